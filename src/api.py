@@ -26,6 +26,9 @@ DRAFT_FILE = os.path.join('outputs', 'paper_draft.txt')
 SYNTHESIS_FILE = os.path.join('outputs', 'synthesis.json')
 PAPERS_FILE = os.path.join('data', 'papers.json')
 ENTITIES_FILE = os.path.join('outputs', 'entities.json')
+ENTITY_INDEX_FILE = os.path.join('outputs', 'entity_index.json')
+KEY_PHRASES_FILE = os.path.join('outputs', 'key_phrases', 'key_phrases.jsonl')
+CORPUS_KEYWORDS_FILE = os.path.join('outputs', 'key_phrases', 'corpus_keywords.json')
 SIMILARITY_FILE = os.path.join('outputs', 'analysis', 'cross_paper_similarity.json')
 PDF_DIR = 'pdf'
 
@@ -36,6 +39,7 @@ class ResearchRequest(BaseModel):
     topic: str
     num_papers: int = 5
     download_pdfs: bool = False
+    collapse_duplicates: bool = False
 
 class ReviseRequest(BaseModel):
     instructions: str
@@ -43,7 +47,8 @@ class ReviseRequest(BaseModel):
 class RefineRequest(BaseModel):
     suggestions: List[str]
 
-async def run_research_pipeline(job_id: str, topic: str, num_papers: int, download_pdfs: bool):
+async def run_research_pipeline(job_id: str, topic: str, num_papers: int, download_pdfs: bool,
+                                collapse_duplicates: bool = False):
     """Actual background worker for the research pipeline"""
     try:
         research_jobs[job_id]["status"] = "processing"
@@ -59,6 +64,8 @@ async def run_research_pipeline(job_id: str, topic: str, num_papers: int, downlo
         from .entity_extractor import extract_and_save_entities
         from .paper_synthesizer import synthesize_papers
         from .paper_drafter import generate_paper_drafts
+        from .text_corpus import RunCorpus
+        from .near_duplicates import collapse_duplicate_papers
 
         papers = fetch_papers(topic, limit=num_papers)
         
@@ -85,9 +92,14 @@ async def run_research_pipeline(job_id: str, topic: str, num_papers: int, downlo
             url = paper.get("url")
             insert_paper(topic, title, authors, year, url)
 
-        research_jobs[job_id]["message"] = "Performing cross-paper analysis..."
-        create_cross_paper_analysis(current_papers=papers)
-        extract_and_save_entities(current_papers=papers)
+        with RunCorpus() as corpus:
+            if collapse_duplicates:
+                research_jobs[job_id]["message"] = "Collapsing near-duplicate papers..."
+                papers = collapse_duplicate_papers(papers, corpus)
+
+            research_jobs[job_id]["message"] = "Performing cross-paper analysis..."
+            create_cross_paper_analysis(current_papers=papers, corpus=corpus)
+            extract_and_save_entities(current_papers=papers, corpus=corpus)
         
         research_jobs[job_id]["message"] = "Synthesizing and drafting paper..."
         synthesize_papers()
@@ -122,7 +134,8 @@ async def start_research(request: ResearchRequest, background_tasks: BackgroundT
         job_id, 
         request.topic, 
         request.num_papers, 
-        request.download_pdfs
+        request.download_pdfs,
+        request.collapse_duplicates
     )
     
     logger.info(f"Started research job {job_id} for topic: {request.topic}")
@@ -183,6 +196,90 @@ async def get_entities():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading entities: {str(e)}")
 
+_entity_index_cache = {}
+
+def _load_entity_index():
+    """Loads the entity index, reusing the parsed copy until the file changes."""
+    from .entity_index import load_entity_index
+
+    if not os.path.exists(ENTITY_INDEX_FILE):
+        return None
+    mtime = os.path.getmtime(ENTITY_INDEX_FILE)
+    if _entity_index_cache.get('mtime') != mtime:
+        _entity_index_cache['index'] = load_entity_index(ENTITY_INDEX_FILE)
+        _entity_index_cache['mtime'] = mtime
+    return _entity_index_cache['index']
+
+@app.get("/api/entities/papers")
+async def get_entity_papers(entity: str):
+    """Get the papers that mention a dataset or method, with mention offsets"""
+    try:
+        index = _load_entity_index()
+        if index is None:
+            return None
+        
+        papers = index.papers_with(entity)
+        return {
+            'entity': index.resolve(entity) or entity,
+            'total_papers': len(papers),
+            'papers': papers
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading entity index: {str(e)}")
+
+@app.get("/api/entities/cooccurring")
+async def get_cooccurring_entities(entity: str, kind: str = "method", limit: int = 20):
+    """Get the datasets or methods most often mentioned alongside an entity"""
+    if kind not in ("method", "dataset"):
+        raise HTTPException(status_code=400, detail="kind must be 'method' or 'dataset'")
+    
+    try:
+        index = _load_entity_index()
+        if index is None:
+            return None
+        
+        counts = index.co_occurring(entity, kind)
+        return {
+            'entity': index.resolve(entity) or entity,
+            'kind': kind,
+            'cooccurring': [{'name': k, 'papers': v} for k, v in counts.most_common(limit)]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading entity index: {str(e)}")
+
+@app.get("/api/key-phrases")
+async def get_key_phrases(paper: Optional[str] = None):
+    """Get per-paper keyword counts from the key-phrase artifact"""
+    from .key_phrase_extractor import load_key_phrases
+
+    try:
+        records = load_key_phrases(KEY_PHRASES_FILE)
+        if paper is not None:
+            if paper not in records:
+                raise HTTPException(status_code=404, detail="Paper not found")
+            return records[paper]
+        return list(records.values())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading key phrases: {str(e)}")
+
+@app.get("/api/key-phrases/corpus")
+async def get_corpus_keywords():
+    """Get the corpus-wide distinctive keywords from the last corpus keyword run"""
+    from .key_phrase_extractor import load_corpus_keywords
+
+    try:
+        data = load_corpus_keywords(CORPUS_KEYWORDS_FILE)
+        if not data:
+            return None
+        return {
+            'total_papers': data['total_papers'],
+            'corpus_keywords': [{'keyword': k, 'score': v} for k, v in data['corpus_keywords'].items()]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading corpus keywords: {str(e)}")
+
 @app.get("/api/synthesis")
 async def get_synthesis():
     """Get synthesis results""" 
@@ -207,44 +304,81 @@ async def get_synthesis():
                 'key_findings': findings_list,
                 'synthesis': data.get('summary', ''),
                 'common_datasets': data.get('common_datasets', {}),
-                'common_methods': data.get('common_methods', {})
+                'common_methods': data.get('common_methods', {}),
+                'paper_keywords': data.get('paper_keywords', {})
             }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading synthesis: {str(e)}")
 
-@app.get("/api/similarity")
-async def get_similarity():
-    """Get cross-paper similarity analysis"""
+_similarity_cache = {}
+
+def _load_similarity_store():
+    """Opens the similarity analysis, keeping its matrix memory-mapped until the file changes."""
+    from .similarity_store import SimilarityStore
+
     if not os.path.exists(SIMILARITY_FILE):
         return None
-    
-    try:
-        with open(SIMILARITY_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
+    mtime = os.path.getmtime(SIMILARITY_FILE)
+    if _similarity_cache.get('mtime') != mtime:
+        _similarity_cache['store'] = SimilarityStore(SIMILARITY_FILE)
+        _similarity_cache['mtime'] = mtime
+    return _similarity_cache['store']
 
-            paper_names = data.get('paper_names', [])
-            matrix = data.get('similarity_matrix', [])
-            
+@app.get("/api/similarity")
+async def get_similarity(limit: Optional[int] = None):
+    """Get cross-paper similarity analysis (the top `limit` pairs if given)"""
+    try:
+        store = _load_similarity_store()
+        if store is None:
+            return None
+        
+        similarities = [
+            {'paper1': paper1, 'paper2': paper2, 'score': score}
+            for paper1, paper2, score in store.ranked_pairs(limit)
+        ]
+        
+        return {
+            'total_papers': store.meta.get('total_papers', 0),
+            'similarities': similarities,
+            'key_findings': store.meta.get('key_findings', {})
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading similarity: {str(e)}")
 
-            similarities = []
-            for i in range(len(matrix)):
-                for j in range(i + 1, len(matrix)):
-                    if i < len(paper_names) and j < len(paper_names):
-                        similarities.append({
-                            'paper1': paper_names[i],
-                            'paper2': paper_names[j],
-                            'score': matrix[i][j] if i < len(matrix) and j < len(matrix[i]) else 0
-                        })
-            
+@app.get("/api/similarity/paper")
+async def get_paper_similarity(paper: str, k: Optional[int] = None):
+    """Get the papers most similar to one paper (all of them unless k is given)"""
+    try:
+        store = _load_similarity_store()
+        if store is None:
+            return None
+        if paper not in store:
+            raise HTTPException(status_code=404, detail="Paper not found")
+        
+        neighbours = store.row(paper) if k is None else store.top_k(paper, k)
+        return {
+            'paper': paper,
+            'neighbours': [{'paper': name, 'score': score} for name, score in neighbours]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading similarity: {str(e)}")
 
-            similarities.sort(key=lambda x: x.get('score', 0), reverse=True)
-            
-            return {
-                'total_papers': data.get('total_papers', 0),
-                'similarities': similarities,
-                'key_findings': data.get('key_findings', {})
-            }
+@app.get("/api/similarity/pair")
+async def get_pair_similarity(paper1: str, paper2: str):
+    """Get the similarity score of two papers"""
+    try:
+        store = _load_similarity_store()
+        if store is None:
+            return None
+        for paper in (paper1, paper2):
+            if paper not in store:
+                raise HTTPException(status_code=404, detail=f"Paper not found: {paper}")
+        
+        return {'paper1': paper1, 'paper2': paper2, 'score': store.pair(paper1, paper2)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading similarity: {str(e)}")
 
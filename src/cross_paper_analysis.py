@@ -1,10 +1,12 @@
 import os
 import json
 from pathlib import Path
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-import re
+from .text_corpus import load_corpus_texts, use_corpus
+from .phrase_matcher import get_phrase_matcher
+from .paper_index import PaperIndex
+from .similarity_model import load_similarity_model
+from .pair_ranking import rank_pairs, rank_neighbour_pairs, named_pairs
+from .similarity_store import save_similarity_matrix, remove_stale_matrices
 
 
 KEY_PHRASES = [
@@ -17,53 +19,19 @@ KEY_PHRASES = [
     "achieves state-of-the-art"
 ]
 
+TOP_K_NEIGHBOURS = 10
 
-def load_extracted_texts(input_folder=os.path.join('outputs', 'extracted_text')):
-    texts = {}
-    
-    if not os.path.exists(input_folder):
-        return texts
-    
-    for text_file in sorted(os.listdir(input_folder)):
-        if text_file.endswith('.txt'):
-            text_path = os.path.join(input_folder, text_file)
-            try:
-                with open(text_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    paper_name = text_file.replace('.txt', '')
-                    texts[paper_name] = content
-            except Exception as e:
-                print(f"Error loading {text_file}: {str(e)}")
-    
-    return texts
 
-
-def extract_key_findings(text, key_phrases=KEY_PHRASES):
-    text_lower = text.lower()
-    findings = {}
-    
-    for phrase in key_phrases:
-        if phrase.lower() in text_lower:
-            findings[phrase] = True
-        else:
-            findings[phrase] = False
-    
-    return [phrase for phrase in key_phrases if findings.get(phrase, False)]
+def load_extracted_texts(input_folder=os.path.join('outputs', 'extracted_text'), names=None):
+    return load_corpus_texts(input_folder, names)
 
 
-def calculate_tfidf_similarity(texts):
-    if len(texts) < 2:
-        return None, None, None
-    
-    paper_names = list(texts.keys())
-    paper_texts = list(texts.values())
+def extract_key_findings(text, key_phrases=KEY_PHRASES, text_lower=None):
+    if text_lower is None:
+        text_lower = text.lower()
+    found = get_phrase_matcher(tuple(key_phrases), lowercase=True).present(text_lower)
     
-    vectorizer = TfidfVectorizer(max_features=500, stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform(paper_texts)
-    
-    similarity_matrix = cosine_similarity(tfidf_matrix)
-    
-    return similarity_matrix, paper_names, tfidf_matrix
+    return [phrase for phrase in key_phrases if phrase in found]
 
 
 def get_pdf_names(pdf_folder='pdf'):
@@ -73,52 +41,46 @@ def get_pdf_names(pdf_folder='pdf'):
     return pdf_files
 
 
+def save_analysis(output_data, output_folder, indent=None):
+    """Atomically writes `cross_paper_similarity.json`, then removes matrices it no longer references."""
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    output_file = os.path.join(output_folder, 'cross_paper_similarity.json')
+    tmp_path = output_file + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(output_data, f, indent=indent)
+    os.replace(tmp_path, output_file)
+    remove_stale_matrices(output_folder, output_data.get("similarity_file"))
+    return output_file
+
+
 def create_cross_paper_analysis(input_folder=os.path.join('outputs', 'extracted_text'), 
                                 output_folder=os.path.join('outputs', 'analysis'),
-                                current_papers=None):
+                                current_papers=None, corpus=None, refit_similarity=False,
+                                similarity_mode='matrix', top_k=TOP_K_NEIGHBOURS):
+    """Finds key phrases and pairwise similarities of the session's papers.
+
+    `similarity_mode='matrix'` stores the dense N x N similarity matrix as a
+    float32 `.npy` file next to the JSON, which only names it; `'neighbours'`
+    stores only each paper's `top_k` most similar papers, computed blockwise
+    from sparse TF-IDF rows, so time and output stay O(N*k).
+    """
+    with use_corpus(corpus, input_folder) as corpus:
+        return _create_cross_paper_analysis(corpus, output_folder, current_papers, refit_similarity,
+                                            similarity_mode, top_k)
+
+
+def _create_cross_paper_analysis(corpus, output_folder, current_papers, refit_similarity=False,
+                                 similarity_mode='matrix', top_k=TOP_K_NEIGHBOURS):
     print("\nExtracting key findings...")
-    texts = load_extracted_texts(input_folder)
+    names = corpus.names()
     
 
     if current_papers:
+        print(f"Target papers to analyze: {len(current_papers)}")
+        names = PaperIndex(corpus.folder).resolve(current_papers, names)
+        print(f"Filtered analysis to {len(names)} papers from current session.")
 
-
-        target_names = set()
-        for p in current_papers:
-            if isinstance(p, dict) and 'title' in p:
-
-
-                safe_title = p['title'].replace(" ", "_")
-
-                safe_title = re.sub(r'[<>":\/\\|?*]', '', safe_title)
-                safe_title = safe_title[:100].strip()
-                target_names.add(safe_title)
-            elif isinstance(p, str):
-                target_names.add(p)
-                
-        print(f"Target papers to analyze: {len(target_names)}")
-
-        filtered_texts = {}
-        for filename, content in texts.items():
-
-            base_filename = filename.replace('.txt', '')
-            
-
-            if base_filename in target_names:
-                filtered_texts[filename] = content
-                continue
-
-
-
-            for target in target_names:
-                if target in base_filename or base_filename in target:
-                    filtered_texts[filename] = content
-                    break
-        
-        texts = filtered_texts
-        
-        texts = filtered_texts
-        print(f"Filtered analysis to {len(texts)} papers from current session.")
+    texts = corpus.texts(names, keep=True)
 
     if len(texts) < 2:
         print("Need at least 2 papers for cross-paper analysis")
@@ -130,46 +92,57 @@ def create_cross_paper_analysis(input_folder=os.path.join('outputs', 'extracted_
             "key_findings": {},
             "similarity_matrix": []
         }
-        Path(output_folder).mkdir(parents=True, exist_ok=True)
-        with open(os.path.join(output_folder, 'cross_paper_similarity.json'), 'w', encoding='utf-8') as f:
-            json.dump(empty_data, f)
+        save_analysis(empty_data, output_folder)
         return
     
     paper_names = list(texts.keys())
     
     findings_dict = {}
     for paper_name, text in texts.items():
-        findings = extract_key_findings(text, KEY_PHRASES)
+        findings = extract_key_findings(text, KEY_PHRASES, corpus.lower(paper_name))
         findings_dict[paper_name] = findings
     
-    print("Computing pairwise TF-IDF similarities between all papers...")
-    similarity_matrix, _, _ = calculate_tfidf_similarity(texts)
-    
-    similarity_matrix_list = similarity_matrix.tolist()
+    dense = similarity_mode != 'neighbours'
+    model = load_similarity_model(corpus, os.path.join(output_folder, 'similarity_model'), refit=refit_similarity)
     
     output_data = {
         "total_papers": len(paper_names),
         "papers": paper_names,
         "paper_names": paper_names,
-        "key_findings": findings_dict,
-        "similarity_matrix": similarity_matrix_list
+        "key_findings": findings_dict
     }
     
-    Path(output_folder).mkdir(parents=True, exist_ok=True)
-    output_file = os.path.join(output_folder, 'cross_paper_similarity.json')
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=2)
-    
-    display_cross_paper_analysis(output_data, paper_names, findings_dict, similarity_matrix)
-    
-    save_table_report(paper_names, findings_dict, similarity_matrix, output_folder)
+    if dense:
+        print("Computing pairwise TF-IDF similarities between all papers...")
+        similarity_matrix = model.similarity_for(paper_names)
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+        output_data["similarity_file"] = save_similarity_matrix(similarity_matrix, output_folder)
+        ranking = rank_pairs(similarity_matrix)
+    else:
+        print(f"Computing the top {top_k} TF-IDF neighbours of each paper...")
+        indices, scores = model.neighbours_for(paper_names, top_k)
+        output_data["similarity_mode"] = "neighbours"
+        output_data["neighbours"] = [
+            [[int(j), round(float(score), 6)] for j, score in zip(row_indices, row_scores)]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+        similarity_matrix = None
+        ranking = rank_neighbour_pairs(indices, scores)
+    
+    output_file = save_analysis(output_data, output_folder, indent=2 if dense else None)
+    
+    display_cross_paper_analysis(output_data, paper_names, findings_dict, similarity_matrix,
+                                 named_pairs(paper_names, *ranking))
+    
+    save_table_report(paper_names, findings_dict, similarity_matrix, output_folder,
+                      named_pairs(paper_names, *ranking))
     
     print(f"\nFinish")
     print(f"Cross-paper analysis saved to: {output_file}")
 
 
-def save_table_report(pdf_names, findings_dict, similarity_matrix, output_folder=os.path.join('outputs', 'analysis')):
+def save_table_report(pdf_names, findings_dict, similarity_matrix, output_folder=os.path.join('outputs', 'analysis'),
+                      pairs_sorted=None):
     output_file = os.path.join(output_folder, 'similarity_table.txt')
     
     try:
@@ -191,13 +164,8 @@ def save_table_report(pdf_names, findings_dict, similarity_matrix, output_folder
             f.write("SIMILARITY MATRIX - TABLE FORMAT\n")
             f.write("-" * 140 + "\n\n")
             
-            pairs = []
-            for i in range(len(pdf_names)):
-                for j in range(i + 1, len(pdf_names)):
-                    score = similarity_matrix[i][j]
-                    pairs.append((pdf_names[i], pdf_names[j], score))
-            
-            pairs_sorted = sorted(pairs, key=lambda x: x[2], reverse=True)
+            if pairs_sorted is None:
+                pairs_sorted = named_pairs(pdf_names, *rank_pairs(similarity_matrix))
             
             header = "| # | Paper 1                                      | Paper 2                                      | Similarity | Score %     |"
             f.write(header + "\n")
@@ -218,7 +186,7 @@ def save_table_report(pdf_names, findings_dict, similarity_matrix, output_folder
         return False, str(e)
 
 
-def display_cross_paper_analysis(output_data, pdf_names, findings_dict, similarity_matrix):
+def display_cross_paper_analysis(output_data, pdf_names, findings_dict, similarity_matrix, pairs_sorted=None):
     print("\n" + "=" * 140)
     print("CROSS-PAPER SIMILARITY ANALYSIS & KEY FINDINGS")
     print("=" * 140)
@@ -236,13 +204,8 @@ def display_cross_paper_analysis(output_data, pdf_names, findings_dict, similari
     print("SIMILARITY MATRIX - TABLE FORMAT")
     print("-" * 140)
     
-    pairs = []
-    for i in range(len(pdf_names)):
-        for j in range(i + 1, len(pdf_names)):
-            score = similarity_matrix[i][j]
-            pairs.append((pdf_names[i], pdf_names[j], score))
-    
-    pairs_sorted = sorted(pairs, key=lambda x: x[2], reverse=True)
+    if pairs_sorted is None:
+        pairs_sorted = named_pairs(pdf_names, *rank_pairs(similarity_matrix))
     
     header = "| # | Paper 1                                      | Paper 2                                      | Similarity | Score %     |"
     print(header)
@@ -1,8 +1,13 @@
 import os
-import re
 import json
+import hashlib
 from pathlib import Path
+from functools import partial
 from collections import Counter
+from .text_corpus import use_corpus, map_corpus
+from .phrase_matcher import PhraseMatcher
+from .entity_index import EntityIndex, ENTITY_INDEX_FILE
+from .paper_index import PaperIndex
 
 DATASET_KEYWORDS = [
     "ImageNet", "CIFAR-10", "CIFAR-100", "MNIST", "COCO", "VOC", "Cityscapes",
@@ -30,80 +35,116 @@ METHOD_KEYWORDS = [
     "U-Net", "YOLO", "SSD", "Mask R-CNN", "Faster R-CNN"
 ]
 
-def extract_entities_from_text(text):
-    text_lower = text.lower()
-    
-    datasets = []
-    for ds in DATASET_KEYWORDS:
-        if re.search(r'\b' + re.escape(ds.lower()) + r'\b', text_lower):
-            datasets.append(ds)
-            
-    methods = []
-    for method in METHOD_KEYWORDS:
-        if re.search(r'\b' + re.escape(method.lower()) + r'\b', text_lower):
-            methods.append(method)
-            
-    return {
-        "datasets": datasets,
-        "methods": methods
-    }
+def load_keyword_file(path):
+    """Reads a vocabulary file with one keyword per line; blank lines and `#` comments are skipped."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+
+class EntityRecognizer:
+    """Recognizes dataset and method keywords in a single pass per document.
+
+    Both vocabularies are compiled once into one case-insensitive,
+    word-bounded PhraseMatcher, so the cost per document does not grow with
+    the number of keywords.
+    """
+
+    def __init__(self, dataset_keywords=DATASET_KEYWORDS, method_keywords=METHOD_KEYWORDS):
+        self.dataset_keywords = list(dataset_keywords)
+        self.method_keywords = list(method_keywords)
+        self.matcher = PhraseMatcher(self.dataset_keywords + self.method_keywords, lowercase=True, word_boundary=True)
+        self.vocabulary = hashlib.sha256(
+            json.dumps([self.dataset_keywords, self.method_keywords]).encode('utf-8')
+        ).hexdigest()
+
+    @classmethod
+    def from_files(cls, dataset_file, method_file):
+        return cls(load_keyword_file(dataset_file), load_keyword_file(method_file))
+
+    def recognize(self, text, text_lower=None):
+        """Returns the keywords found in `text`, with mention counts and offsets into the lowercased text."""
+        if text_lower is None:
+            text_lower = text.lower()
+        
+        offsets = {}
+        for keyword, start, _ in self.matcher.finditer(text_lower):
+            offsets.setdefault(keyword, []).append(start)
+        
+        datasets = [ds for ds in self.dataset_keywords if ds in offsets]
+        methods = [method for method in self.method_keywords if method in offsets]
+        
+        return {
+            "datasets": datasets,
+            "methods": methods,
+            "mentions": {
+                keyword: {"count": len(offsets[keyword]), "offsets": offsets[keyword]}
+                for keyword in dict.fromkeys(datasets + methods)
+            }
+        }
+
+
+_default_recognizer = None
+
+
+def get_entity_recognizer():
+    global _default_recognizer
+    if _default_recognizer is None:
+        _default_recognizer = EntityRecognizer()
+    return _default_recognizer
+
+
+def extract_entities_from_text(text, text_lower=None, recognizer=None):
+    return (recognizer or get_entity_recognizer()).recognize(text, text_lower)
+
+def _recognize_task(corpus, paper_name, recognizer):
+    try:
+        return recognizer.recognize(corpus.text(paper_name), corpus.lower(paper_name)), None
+    except Exception as e:
+        return None, str(e)
+
 
 def extract_and_save_entities(input_folder=os.path.join('outputs', 'extracted_text'), 
                               output_file=os.path.join('outputs', 'entities.json'),
-                              current_papers=None):
+                              current_papers=None, corpus=None, recognizer=None,
+                              index_file=ENTITY_INDEX_FILE, workers=None):
     print("\nExtracting datasets, methods, and algorithms...")
     
-    if not os.path.exists(input_folder):
+    if corpus is None and not os.path.exists(input_folder):
         print(f"Input folder {input_folder} does not exist.")
         return {}
-
-
-    target_names = set()
-    if current_papers:
-        for p in current_papers:
-            if isinstance(p, dict) and 'title' in p:
-                safe_title = p['title'].replace(" ", "_")
-                safe_title = re.sub(r'[<>":\/\\|?*]', '', safe_title)
-                safe_title = safe_title[:100].strip()
-                target_names.add(safe_title)
-            elif isinstance(p, str):
-                target_names.add(p)
     
     all_extracted = {}
     aggregated_datasets = Counter()
     aggregated_methods = Counter()
     
-    for text_file in os.listdir(input_folder):
-        if text_file.endswith('.txt'):
-            paper_name = text_file.replace('.txt', '')
-            
-
-            if target_names:
-                matched = False
-                if paper_name in target_names:
-                    matched = True
-                else:
-                    for target in target_names:
-                        if target in paper_name or paper_name in target:
-                            matched = True
-                            break
-                if not matched:
-                    continue
-
-            text_path = os.path.join(input_folder, text_file)
-            try:
-                with open(text_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                entities = extract_entities_from_text(content)
-                all_extracted[paper_name] = entities
-                
-                aggregated_datasets.update(entities['datasets'])
-                aggregated_methods.update(entities['methods'])
-                
-            except Exception as e:
-                print(f"Error processing {text_file}: {str(e)}")
-                
+    recognizer = recognizer or get_entity_recognizer()
+    index = EntityIndex(index_file, vocabulary=recognizer.vocabulary)
+    
+    with use_corpus(corpus, input_folder) as corpus:
+        paper_names = corpus.names()
+        if current_papers:
+            paper_names = PaperIndex(corpus.folder).resolve(current_papers, paper_names)
+        fingerprints = {name: corpus.fingerprint(name) for name in paper_names}
+        stale = [name for name in paper_names if index.get(name, fingerprints[name]) is None]
+        
+        task = partial(_recognize_task, recognizer=recognizer)
+        for paper_name, (entities, error) in zip(stale, map_corpus(corpus, task, stale, workers)):
+            if error is not None:
+                print(f"Error processing {paper_name}.txt: {error}")
+                continue
+            index.update(paper_name, fingerprints[paper_name], entities)
+        
+        for paper_name in paper_names:
+            entities = index.get(paper_name, fingerprints[paper_name])
+            if entities is None:
+                continue
+            all_extracted[paper_name] = entities
+            aggregated_datasets.update(entities['datasets'])
+            aggregated_methods.update(entities['methods'])
+        
+        index.prune(set(corpus.names()))
+    index.save()
+    
     output_data = {
         "per_paper_entities": all_extracted,
         "common_entities": {
@@ -0,0 +1,132 @@
+import os
+import json
+from collections import Counter
+from .logger import logger
+
+ENTITY_INDEX_FILE = os.path.join('outputs', 'entity_index.json')
+INDEX_VERSION = 1
+
+
+class EntityIndex:
+    """Persistent inverted index from entity keywords to the papers that mention them.
+
+    `papers` keeps, per paper, the corpus fingerprint its entities were
+    extracted from and the datasets/methods found. `entities` maps every
+    keyword to its kinds (`dataset`, `method`) and to `{paper: [offsets]}`,
+    with offsets into the lowercased text. Papers whose text is unchanged
+    since the last run are served from the index instead of being rescanned.
+    """
+
+    def __init__(self, path=ENTITY_INDEX_FILE, vocabulary=None):
+        self.path = path
+        self.vocabulary = vocabulary
+        self.papers = {}
+        self.entities = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Rebuilding unreadable entity index {self.path}: {e}")
+            return
+        if data.get('version') != INDEX_VERSION:
+            return
+        if self.vocabulary is not None and data.get('vocabulary') != self.vocabulary:
+            logger.info("Entity vocabulary changed, rebuilding the entity index")
+            return
+        self.vocabulary = data.get('vocabulary')
+        self.papers = data.get('papers', {})
+        self.entities = data.get('entities', {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'vocabulary': self.vocabulary,
+                       'papers': self.papers, 'entities': self.entities}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, paper_name, fingerprint):
+        """Returns the stored entities of `paper_name` if they were extracted from the same text."""
+        entry = self.papers.get(paper_name)
+        if entry is None or entry.get('fingerprint') != fingerprint:
+            return None
+        return {
+            'datasets': entry['datasets'],
+            'methods': entry['methods'],
+            'mention_counts': {keyword: len(self.entities[keyword]['papers'][paper_name])
+                               for keyword in dict.fromkeys(entry['datasets'] + entry['methods'])}
+        }
+
+    def update(self, paper_name, fingerprint, entities):
+        """Replaces the postings of `paper_name` with the result of EntityRecognizer.recognize."""
+        self.remove(paper_name)
+        self.papers[paper_name] = {
+            'fingerprint': fingerprint,
+            'datasets': entities['datasets'],
+            'methods': entities['methods']
+        }
+        for kind, keywords in (('dataset', entities['datasets']), ('method', entities['methods'])):
+            for keyword in keywords:
+                posting = self.entities.setdefault(keyword, {'kinds': [], 'papers': {}})
+                if kind not in posting['kinds']:
+                    posting['kinds'].append(kind)
+                posting['papers'][paper_name] = entities['mentions'][keyword]['offsets']
+
+    def remove(self, paper_name):
+        entry = self.papers.pop(paper_name, None)
+        if entry is None:
+            return
+        for keyword in dict.fromkeys(entry['datasets'] + entry['methods']):
+            posting = self.entities.get(keyword)
+            if posting is None:
+                continue
+            posting['papers'].pop(paper_name, None)
+            if not posting['papers']:
+                del self.entities[keyword]
+
+    def prune(self, paper_names):
+        """Drops papers that are no longer in the corpus."""
+        for paper_name in [name for name in self.papers if name not in paper_names]:
+            self.remove(paper_name)
+
+    def resolve(self, entity):
+        """Returns the indexed keyword matching `entity` case-insensitively, or None."""
+        if entity in self.entities:
+            return entity
+        entity_lower = entity.lower()
+        for keyword in self.entities:
+            if keyword.lower() == entity_lower:
+                return keyword
+        return None
+
+    def papers_with(self, entity):
+        """Returns `[{paper, mentions, offsets}]` for the papers mentioning `entity`, most mentions first."""
+        keyword = self.resolve(entity)
+        if keyword is None:
+            return []
+        papers = [
+            {'paper': paper_name, 'mentions': len(offsets), 'offsets': offsets}
+            for paper_name, offsets in self.entities[keyword]['papers'].items()
+        ]
+        papers.sort(key=lambda x: (-x['mentions'], x['paper']))
+        return papers
+
+    def co_occurring(self, entity, kind='method'):
+        """Counts, over the papers mentioning `entity`, how many also mention each entity of `kind`."""
+        keyword = self.resolve(entity)
+        counts = Counter()
+        if keyword is None:
+            return counts
+        field = 'datasets' if kind == 'dataset' else 'methods'
+        for paper_name in self.entities[keyword]['papers']:
+            counts.update(other for other in self.papers[paper_name][field] if other != keyword)
+        return counts
+
+
+def load_entity_index(path=ENTITY_INDEX_FILE):
+    return EntityIndex(path)
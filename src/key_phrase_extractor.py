@@ -1,7 +1,13 @@
 import os
 import re
+import json
 from pathlib import Path
+from functools import lru_cache
 from collections import Counter
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+from .text_corpus import use_corpus, map_corpus
+from .phrase_matcher import get_phrase_matcher
 
 
 KEY_PHRASES = [
@@ -14,6 +20,20 @@ KEY_PHRASES = [
     "achieves state-of-the-art"
 ]
 
+SPACY_MODEL = 'en_core_web_sm'
+SPACY_DISABLED_PIPES = ['ner', 'lemmatizer', 'textcat']
+SPACY_MAX_CHARS = 1000000
+NOUN_PHRASE_BATCH_SIZE = 8
+
+STOP_WORDS = {'the', 'and', 'for', 'are', 'that', 'with', 'from', 'this', 'which', 'have', 'been', 'can', 'will', 'not', 'were', 'has', 'was', 'all', 'their', 'more', 'when', 'used', 'would', 'into', 'being', 'such', 'each', 'or', 'also', 'other', 'where', 'some', 'than', 'them', 'its', 'our', 'we', 'as', 'to', 'in', 'is', 'by', 'on', 'at', 'an', 'a', 'of', 'it'}
+KEYWORD_TOKEN_PATTERN = r'\b[a-z]{4,}\b'
+
+KEY_PHRASES_FILENAME = 'key_phrases.jsonl'
+KEY_PHRASES_FILE = os.path.join('outputs', 'key_phrases', KEY_PHRASES_FILENAME)
+CORPUS_KEYWORDS_FILENAME = 'corpus_keywords.json'
+CORPUS_KEYWORDS_FILE = os.path.join('outputs', 'key_phrases', CORPUS_KEYWORDS_FILENAME)
+CORPUS_KEYWORDS_REPORT = 'corpus_keywords.txt'
+
 
 def clean_text(text):
     text = re.sub(r'---\s*Page\s*\d+\s*---', '', text)
@@ -24,101 +44,332 @@ def clean_text(text):
 
 def extract_key_findings_from_phrases(text, key_phrases=KEY_PHRASES, context_size=100):
     text_lower = text.lower()
-    findings = {}
-    
-    for phrase in key_phrases:
-        matches = []
-        pattern = re.escape(phrase)
-        for match in re.finditer(pattern, text_lower):
-            start = max(0, match.start() - context_size)
-            end = min(len(text_lower), match.end() + context_size)
-            context = text_lower[start:end].replace('\n', ' ').strip()
-            matches.append(context)
-        
-        if matches:
-            findings[phrase] = matches
+    matches = {}
     
-    return findings
+    for phrase, match_start, match_end in get_phrase_matcher(tuple(key_phrases)).finditer(text_lower):
+        start = max(0, match_start - context_size)
+        end = min(len(text_lower), match_end + context_size)
+        context = text_lower[start:end].replace('\n', ' ').strip()
+        matches.setdefault(phrase, []).append(context)
+    
+    return {phrase: matches[phrase] for phrase in key_phrases if phrase in matches}
 
 
 def extract_frequency_keywords(text, top_n=30):
     text_lower = text.lower()
     words = re.findall(r'\b[a-z]{3,}\b', text_lower)
-    stop_words = {'the', 'and', 'for', 'are', 'that', 'with', 'from', 'this', 'which', 'have', 'been', 'can', 'will', 'not', 'were', 'has', 'was', 'all', 'their', 'more', 'when', 'used', 'would', 'into', 'being', 'such', 'each', 'or', 'also', 'other', 'where', 'some', 'than', 'them', 'its', 'our', 'we', 'as', 'to', 'in', 'is', 'by', 'on', 'at', 'an', 'a', 'of', 'it'}
     
-    filtered_words = [w for w in words if w not in stop_words and len(w) > 3]
+    filtered_words = [w for w in words if w not in STOP_WORDS and len(w) > 3]
     word_freq = Counter(filtered_words)
     return word_freq.most_common(top_n)
 
 
-def extract_noun_phrases(text, top_n=20):
+def top_n_per_row(matrix, top_n):
+    """Returns, for every row of a sparse matrix, the `(column, value)` pairs of its `top_n` largest entries.
+
+    Rows are ranked with one lexsort over all non-zeros (value descending,
+    then column), so ties go to the lower column index.
+    """
+    matrix = matrix.tocsr()
+    row_ids = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((matrix.indices, -matrix.data, row_ids))
+    rank = np.arange(len(order)) - matrix.indptr[row_ids[order]]
+    keep = order[rank < top_n]
+    columns, values = matrix.indices[keep], matrix.data[keep]
+    bounds = np.searchsorted(row_ids[keep], np.arange(matrix.shape[0] + 1))
+    return [
+        list(zip(columns[start:end].tolist(), values[start:end].tolist()))
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def extract_corpus_keywords(texts, top_n=30, distinctive_n=30):
+    """Keyword statistics for a whole corpus from a single vectorizer pass.
+
+    `texts` maps paper names to cleaned text. One sparse count matrix yields
+    each paper's most frequent keywords (the same tokens and stop words as
+    `extract_frequency_keywords`, ties broken alphabetically), its most
+    distinctive keywords by TF-IDF weight, and the corpus-wide distinctive
+    keywords by summed TF-IDF weight.
+    """
+    names = list(texts)
+    if not names:
+        return {'frequency_keywords': {}, 'distinctive_keywords': {}, 'corpus_keywords': []}
+    
+    vectorizer = CountVectorizer(token_pattern=KEYWORD_TOKEN_PATTERN, stop_words=sorted(STOP_WORDS), dtype=np.int64)
+    try:
+        counts = vectorizer.fit_transform(texts[name] for name in names)
+    except ValueError:
+        empty = {name: [] for name in names}
+        return {'frequency_keywords': empty, 'distinctive_keywords': dict(empty), 'corpus_keywords': []}
+    vocabulary = vectorizer.get_feature_names_out()
+    tfidf = TfidfTransformer().fit_transform(counts)
+    
+    weights = np.asarray(tfidf.sum(axis=0)).ravel()
+    corpus_top = np.argsort(-weights, kind='stable')[:distinctive_n]
+    
+    return {
+        'frequency_keywords': {
+            name: [(vocabulary[col], int(count)) for col, count in row]
+            for name, row in zip(names, top_n_per_row(counts, top_n))
+        },
+        'distinctive_keywords': {
+            name: [(vocabulary[col], round(float(score), 4)) for col, score in row]
+            for name, row in zip(names, top_n_per_row(tfidf, distinctive_n))
+        },
+        'corpus_keywords': [(vocabulary[col], round(float(weights[col]), 4)) for col in corpus_top]
+    }
+
+
+@lru_cache(maxsize=1)
+def get_nlp():
+    """Loads the spaCy model once per process, without the pipes noun chunking does not need; None if unavailable."""
     try:
         import spacy
-        nlp = spacy.load('en_core_web_sm')
-    except:
+        return spacy.load(SPACY_MODEL, disable=SPACY_DISABLED_PIPES)
+    except Exception:
+        return None
+
+
+def _count_noun_phrases(doc, top_n):
+    phrases = []
+    for chunk in doc.noun_chunks:
+        if len(chunk.text.split()) <= 3 and len(chunk.text) > 3:
+            phrases.append(chunk.text.lower())
+    
+    phrase_freq = Counter(phrases)
+    return phrase_freq.most_common(top_n)
+
+
+def extract_noun_phrases(text, top_n=20):
+    nlp = get_nlp()
+    if nlp is None:
         return extract_frequency_keywords(text, top_n)
     
     try:
-        doc = nlp(text[:1000000])
-        phrases = []
-        for chunk in doc.noun_chunks:
-            if len(chunk.text.split()) <= 3 and len(chunk.text) > 3:
-                phrases.append(chunk.text.lower())
-        
-        phrase_freq = Counter(phrases)
-        return phrase_freq.most_common(top_n)
-    except:
+        return _count_noun_phrases(nlp(text[:SPACY_MAX_CHARS]), top_n)
+    except Exception:
         return extract_frequency_keywords(text, top_n)
 
 
-def extract_key_phrases_from_text(text_content, top_n=30):
-    cleaned_text = clean_text(text_content)
+def extract_noun_phrases_batch(texts, top_n=20, batch_size=NOUN_PHRASE_BATCH_SIZE, n_process=1):
+    """Runs noun-phrase extraction over many texts with one `nlp.pipe` call, in input order.
+
+    `n_process > 1` lets spaCy parse in that many worker processes. Falls
+    back to frequency keywords when the model is unavailable or parsing fails.
+    """
+    texts = list(texts)
+    nlp = get_nlp()
+    if nlp is None:
+        return [extract_frequency_keywords(text, top_n) for text in texts]
+    
+    try:
+        docs = nlp.pipe((text[:SPACY_MAX_CHARS] for text in texts), batch_size=batch_size, n_process=n_process)
+        return [_count_noun_phrases(doc, top_n) for doc in docs]
+    except Exception:
+        return [extract_noun_phrases(text, top_n) for text in texts]
+
+
+def extract_corpus_noun_phrases(input_folder=os.path.join('outputs', 'extracted_text'), corpus=None, top_n=20,
+                                batch_size=NOUN_PHRASE_BATCH_SIZE, n_process=1):
+    """Returns `{paper_name: [(phrase, count), ...]}` for every document of the corpus."""
+    if corpus is None and not os.path.exists(input_folder):
+        return {}
+    
+    with use_corpus(corpus, input_folder) as corpus:
+        names = corpus.names()
+        phrases = extract_noun_phrases_batch((corpus.text(name) for name in names), top_n, batch_size, n_process)
+        return dict(zip(names, phrases))
+
+
+def extract_key_phrases_from_text(text_content, top_n=30, cleaned_text=None, tokens=None):
+    if cleaned_text is None:
+        cleaned_text = clean_text(text_content)
+    if tokens is None:
+        tokens = cleaned_text.split()
     
     frequency_keywords = extract_frequency_keywords(cleaned_text, top_n)
     
     return {
         'frequency_keywords': frequency_keywords,
-        'total_words': len(cleaned_text.split())
+        'total_words': len(tokens)
     }
 
 
-def process_all_extracted_texts(input_folder=os.path.join('outputs', 'extracted_text'), output_folder=os.path.join('outputs', 'key_phrases')):
+def _key_phrase_task(corpus, paper_name, noun_phrases=None, paper_keywords=None):
+    """Key-phrase record of one paper; `noun_phrases`/`paper_keywords` are that paper's precomputed slices."""
+    text_file = f"{paper_name}.txt"
+    
+    try:
+        if paper_keywords is None:
+            phrases_data = extract_key_phrases_from_text(None, cleaned_text=corpus.cleaned(paper_name))
+        else:
+            phrases_data = paper_keywords
+        
+        record = {
+            'status': 'Success',
+            'paper': paper_name,
+            'text_file': text_file,
+            'total_words': phrases_data['total_words'],
+            'frequency_keywords': dict(phrases_data['frequency_keywords'])
+        }
+        if 'distinctive_keywords' in phrases_data:
+            record['distinctive_keywords'] = dict(phrases_data['distinctive_keywords'])
+        if noun_phrases is not None:
+            record['noun_phrases'] = dict(noun_phrases)
+        return record
+        
+    except Exception as e:
+        return {'status': 'Failed', 'paper': paper_name, 'text_file': text_file, 'error': str(e)}
+
+
+def save_key_phrases(records, output_file=KEY_PHRASES_FILE):
+    """Writes one JSON record per paper (keyword -> count, in rank order) to a JSON-lines file."""
+    Path(os.path.dirname(output_file)).mkdir(parents=True, exist_ok=True)
+    tmp_path = output_file + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_file)
+
+
+def save_corpus_keywords(corpus_keywords, total_papers, output_file=CORPUS_KEYWORDS_FILE):
+    """Writes the corpus-wide distinctive keywords (keyword -> summed TF-IDF weight, in rank order)."""
+    Path(os.path.dirname(output_file)).mkdir(parents=True, exist_ok=True)
+    tmp_path = output_file + '.tmp'
+    data = {'total_papers': total_papers, 'corpus_keywords': dict(corpus_keywords)}
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, output_file)
+    return data
+
+
+def load_corpus_keywords(input_file=CORPUS_KEYWORDS_FILE):
+    """Returns the corpus keyword file written in corpus keyword mode, or {} if there is none."""
+    if not os.path.exists(input_file):
+        return {}
+    with open(input_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_key_phrases(input_file=KEY_PHRASES_FILE):
+    """Returns `{paper_name: record}` from the key-phrase JSON-lines file, or {} if it does not exist."""
+    if not os.path.exists(input_file):
+        return {}
+    
+    records = {}
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records[record['paper']] = record
+    return records
+
+
+def write_key_phrase_reports(records=None, output_folder=os.path.join('outputs', 'key_phrases'), corpus_keywords=None):
+    """Renders the formatted `*_keyphrases.txt` report of every paper from its key-phrase record.
+
+    The corpus keywords (by default read from the corpus keyword file in
+    `output_folder`) get a `corpus_keywords.txt` report of their own.
+    """
+    if records is None:
+        records = load_key_phrases(os.path.join(output_folder, KEY_PHRASES_FILENAME))
+    if corpus_keywords is None:
+        corpus_keywords = load_corpus_keywords(os.path.join(output_folder, CORPUS_KEYWORDS_FILENAME))
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    
+    written = []
+    if corpus_keywords:
+        with open(os.path.join(output_folder, CORPUS_KEYWORDS_REPORT), 'w', encoding='utf-8') as f:
+            f.write(f"Corpus Keywords from: {corpus_keywords['total_papers']} papers\n")
+            f.write("=" * 80 + "\n\n")
+            f.write("DISTINCTIVE CORPUS KEYWORDS (summed TF-IDF):\n")
+            f.write("-" * 80 + "\n")
+            for i, (phrase, score) in enumerate(corpus_keywords['corpus_keywords'].items(), 1):
+                f.write(f"{i:2d}. {phrase:40s} (tf-idf: {score:.4f})\n")
+        written.append(CORPUS_KEYWORDS_REPORT)
+    for record in records.values():
+        output_filename = f"{record['paper']}_keyphrases.txt"
+        with open(os.path.join(output_folder, output_filename), 'w', encoding='utf-8') as f:
+            f.write(f"Key Phrases from: {record['text_file']}\n")
+            f.write(f"Total Words: {record['total_words']}\n")
+            f.write("=" * 80 + "\n\n")
+            
+            f.write("TOP KEYWORDS (Frequency-Based):\n")
+            f.write("-" * 80 + "\n")
+            for i, (phrase, freq) in enumerate(record['frequency_keywords'].items(), 1):
+                f.write(f"{i:2d}. {phrase:40s} (frequency: {freq})\n")
+            
+            if 'distinctive_keywords' in record:
+                f.write("\nDISTINCTIVE KEYWORDS (TF-IDF):\n")
+                f.write("-" * 80 + "\n")
+                for i, (phrase, score) in enumerate(record['distinctive_keywords'].items(), 1):
+                    f.write(f"{i:2d}. {phrase:40s} (tf-idf: {score:.4f})\n")
+            
+            if 'noun_phrases' in record:
+                f.write("\nTOP NOUN PHRASES:\n")
+                f.write("-" * 80 + "\n")
+                for i, (phrase, freq) in enumerate(record['noun_phrases'].items(), 1):
+                    f.write(f"{i:2d}. {phrase:40s} (frequency: {freq})\n")
+        written.append(output_filename)
+    return written
+
+
+def process_all_extracted_texts(input_folder=os.path.join('outputs', 'extracted_text'), output_folder=os.path.join('outputs', 'key_phrases'),
+                                corpus=None, workers=None, noun_phrases=False, spacy_processes=1,
+                                keyword_mode='document', reports=False):
+    """Extracts key phrases for every paper into `key_phrases.jsonl`; `reports` also renders the text reports.
+
+    With `keyword_mode='corpus'`, the corpus-wide distinctive keywords are
+    written to `corpus_keywords.json` next to it (see load_corpus_keywords);
+    a document-mode run removes that file.
+    """
     Path(output_folder).mkdir(parents=True, exist_ok=True)
     results = []
     
-    if not os.path.exists(input_folder):
+    if corpus is None and not os.path.exists(input_folder):
         return results
     
-    for text_file in os.listdir(input_folder):
-        if text_file.endswith('.txt'):
-            text_path = os.path.join(input_folder, text_file)
-            output_filename = text_file.replace('.txt', '_keyphrases.txt')
-            
-            print(f"Extracting key phrases from {text_file}...")
-            
-            try:
-                with open(text_path, 'r', encoding='utf-8') as f:
-                    text_content = f.read()
-                
-                phrases_data = extract_key_phrases_from_text(text_content)
-                
-                output_path = os.path.join(output_folder, output_filename)
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(f"Key Phrases from: {text_file}\n")
-                    f.write(f"Total Words: {phrases_data['total_words']}\n")
-                    f.write("=" * 80 + "\n\n")
-                    
-                    f.write("TOP KEYWORDS (Frequency-Based):\n")
-                    f.write("-" * 80 + "\n")
-                    for i, (phrase, freq) in enumerate(phrases_data['frequency_keywords'], 1):
-                        f.write(f"{i:2d}. {phrase:40s} (frequency: {freq})\n")
-                
-                file_size = os.path.getsize(output_path) / 1024
-                results.append({'text_file': text_file, 'output': output_filename, 'status': 'Success', 'size_kb': file_size})
-                print(f"  Key phrases saved to {output_filename} ({file_size:.2f} KB)")
-                
-            except Exception as e:
-                results.append({'text_file': text_file, 'output': output_filename, 'status': 'Failed', 'error': str(e)})
-                print(f"  Failed: {str(e)}")
+    records = {}
+    with use_corpus(corpus, input_folder) as corpus:
+        names = corpus.names()
+        phrases = extract_corpus_noun_phrases(corpus=corpus, n_process=spacy_processes) if noun_phrases else {}
+        keywords = None
+        if keyword_mode == 'corpus':
+            cleaned = {name: corpus.cleaned(name) for name in names}
+            total_words = {name: len(text.split()) for name, text in cleaned.items()}
+            keywords = extract_corpus_keywords(cleaned)
+            del cleaned
+            workers = 1
+        args = [
+            (phrases.get(name) if noun_phrases else None,
+             {'frequency_keywords': keywords['frequency_keywords'][name],
+              'distinctive_keywords': keywords['distinctive_keywords'][name],
+              'total_words': total_words[name]} if keywords else None)
+            for name in names
+        ]
+        for record in map_corpus(corpus, _key_phrase_task, names, workers, args):
+            if record.pop('status') == 'Success':
+                records[record['paper']] = record
+                results.append({'text_file': record['text_file'], 'status': 'Success', 'total_words': record['total_words']})
+            else:
+                results.append({'text_file': record['text_file'], 'status': 'Failed', 'error': record['error']})
+                print(f"  Failed to extract key phrases from {record['text_file']}: {record['error']}")
+    
+    output_file = os.path.join(output_folder, KEY_PHRASES_FILENAME)
+    save_key_phrases(records.values(), output_file)
+    print(f"Key phrases for {len(records)} papers saved to {output_file}")
+    
+    corpus_keywords_file = os.path.join(output_folder, CORPUS_KEYWORDS_FILENAME)
+    corpus_keywords = {}
+    if keywords is not None:
+        corpus_keywords = save_corpus_keywords(keywords['corpus_keywords'], len(names), corpus_keywords_file)
+        print(f"Corpus keywords saved to {corpus_keywords_file}")
+    elif os.path.exists(corpus_keywords_file):
+        os.remove(corpus_keywords_file)
+    
+    if reports:
+        written = write_key_phrase_reports(records, output_folder, corpus_keywords)
+        print(f"  Wrote {len(written)} key-phrase reports to {output_folder}")
     
     return results
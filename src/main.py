@@ -8,6 +8,7 @@ from .cross_paper_analysis import create_cross_paper_analysis
 from .entity_extractor import extract_and_save_entities
 from .paper_synthesizer import synthesize_papers
 from .paper_drafter import generate_paper_drafts
+from .text_corpus import RunCorpus
 
 print("\n===== AI Research Paper Fetcher =====\n")
 
@@ -58,9 +59,10 @@ print(f"JSON File: data/papers.json")
 
 list_downloaded_pdfs()
 
-create_cross_paper_analysis(current_papers=papers)
+with RunCorpus() as corpus:
+    create_cross_paper_analysis(current_papers=papers, corpus=corpus)
 
-extract_and_save_entities()
+    extract_and_save_entities(corpus=corpus)
 
 synthesize_papers()
 generate_paper_drafts()
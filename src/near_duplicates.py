@@ -0,0 +1,135 @@
+import os
+import json
+import zlib
+import numpy as np
+from pathlib import Path
+from .paper_index import PaperIndex
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+LSH_BANDS = 16
+DUPLICATE_THRESHOLD = 0.8
+MINHASH_SEED = 1
+MINHASH_CHUNK = 8192
+SHINGLE_MULTIPLIER = 0x01000193
+
+
+def shingle_hashes(tokens, size=SHINGLE_SIZE):
+    """Distinct 32-bit hashes of the `size`-word shingles of a token list.
+
+    Every distinct token is hashed once with crc32; a shingle's hash is a
+    polynomial of its token hashes, computed for all windows at once.
+    """
+    if not tokens:
+        return np.zeros(0, dtype=np.uint32)
+    token_hash = {token: zlib.crc32(token.encode('utf-8')) for token in set(tokens)}
+    hashes = np.fromiter((token_hash[token] for token in tokens), dtype=np.uint32, count=len(tokens))
+    width = min(size, len(hashes))
+    windows = len(hashes) - width + 1
+    shingles = np.zeros(windows, dtype=np.uint32)
+    for offset in range(width):
+        shingles = shingles * np.uint32(SHINGLE_MULTIPLIER) + hashes[offset:offset + windows]
+    return np.unique(shingles)
+
+
+class MinHasher:
+    """MinHash signatures from `num_perm` random permutations `x -> a*x + b (mod 2**32)` with odd `a`."""
+
+    def __init__(self, num_perm=NUM_PERM, seed=MINHASH_SEED):
+        rng = np.random.default_rng(seed)
+        self.a = (rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64).astype(np.uint32) | np.uint32(1))[:, None]
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64).astype(np.uint32)[:, None]
+        self.num_perm = num_perm
+
+    def signature(self, hashes):
+        signature = np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        for start in range(0, len(hashes), MINHASH_CHUNK):
+            chunk = hashes[start:start + MINHASH_CHUNK][None, :]
+            np.minimum(signature, (self.a * chunk + self.b).min(axis=1), out=signature)
+        return signature
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_near_duplicates(corpus, names=None, threshold=DUPLICATE_THRESHOLD, num_perm=NUM_PERM, bands=LSH_BANDS,
+                         shingle_size=SHINGLE_SIZE):
+    """Groups papers whose shingled texts have an estimated Jaccard similarity of at least `threshold`.
+
+    Each text is reduced to a MinHash signature, the signatures are split
+    into `bands` bands and hashed into buckets, and only papers sharing a
+    bucket are compared, so the cost grows with the number of papers rather
+    than the number of pairs. Returns clusters of two or more names, each
+    ordered with the longest text (the representative to keep) first.
+    """
+    names = corpus.names() if names is None else list(names)
+    rows = num_perm // bands
+    hasher = MinHasher(bands * rows)
+    lengths = {}
+    shingles = []
+    for name in names:
+        tokens = corpus.tokens(name)
+        lengths[name] = len(tokens)
+        shingles.append(shingle_hashes(tokens, shingle_size))
+    signatures = np.array([hasher.signature(hashes) for hashes in shingles],
+                          dtype=np.uint32).reshape(len(names), bands * rows)
+    candidates = [i for i, hashes in enumerate(shingles) if len(hashes)]
+
+    buckets = {}
+    for band in range(bands):
+        keys = signatures[:, band * rows:(band + 1) * rows]
+        for i in candidates:
+            buckets.setdefault((band, keys[i].tobytes()), []).append(i)
+
+    parent = list(range(len(names)))
+    checked = set()
+    for members in buckets.values():
+        for position, i in enumerate(members):
+            for j in members[position + 1:]:
+                if (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                if np.mean(signatures[i] == signatures[j]) >= threshold:
+                    parent[_find(parent, j)] = _find(parent, i)
+
+    clusters = {}
+    for i in range(len(names)):
+        clusters.setdefault(_find(parent, i), []).append(names[i])
+    return [
+        sorted(cluster, key=lambda name: (-lengths[name], name))
+        for cluster in clusters.values() if len(cluster) > 1
+    ]
+
+
+def collapse_duplicate_papers(papers, corpus, threshold=DUPLICATE_THRESHOLD,
+                              output_file=os.path.join('outputs', 'analysis', 'near_duplicates.json')):
+    """Drops papers whose extracted text nearly duplicates another paper of the list.
+
+    Only the representative (longest text) of each duplicate cluster is
+    kept; papers without extracted text are always kept. The clusters are
+    written to `output_file`.
+    """
+    index = PaperIndex(corpus.folder)
+    available = set(corpus.names())
+    paper_texts = [[name for name in index.lookup(paper) if name in available] for paper in papers]
+    names = sorted({name for texts in paper_texts for name in texts})
+
+    clusters = find_near_duplicates(corpus, names, threshold) if len(names) > 1 else []
+    duplicates = {name for cluster in clusters for name in cluster[1:]}
+
+    Path(os.path.dirname(output_file)).mkdir(parents=True, exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({"threshold": threshold, "clusters": clusters}, f, indent=2)
+
+    kept = []
+    for paper, texts in zip(papers, paper_texts):
+        if texts and all(name in duplicates for name in texts):
+            continue
+        kept.append(paper)
+    if len(kept) < len(papers):
+        print(f"Collapsed {len(papers) - len(kept)} near-duplicate papers ({len(clusters)} clusters)")
+    return kept
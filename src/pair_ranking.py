@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def _upper_pair_positions(flat, n):
+    """Converts positions into the row-major upper triangle (i < j) of an n x n matrix to `(rows, cols)`."""
+    starts = np.concatenate([[0], np.cumsum(np.arange(n - 1, 0, -1, dtype=np.int64))])
+    rows = np.searchsorted(starts, flat, side='right') - 1
+    cols = flat - starts[rows] + rows + 1
+    return rows, cols
+
+
+def _rank(scores, top_k=None):
+    """Positions of `scores` ordered highest first (ties keep their order), cut to `top_k` with argpartition."""
+    if top_k is None or top_k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    if top_k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    kth = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+    above = np.flatnonzero(scores > kth)
+    top = np.concatenate([above, np.flatnonzero(scores == kth)[:top_k - len(above)]])
+    return top[np.lexsort((top, -scores[top]))]
+
+
+def rank_pairs(matrix, top_k=None):
+    """Ranks the distinct pairs `i < j` of a square score matrix, highest score first.
+
+    Scores are read from the upper triangle in one vectorized step and only
+    the ranked positions are turned back into row/column indices, so no
+    per-pair Python objects are created. With `top_k`, only the best `top_k`
+    pairs are selected (argpartition) and sorted. Returns `(rows, cols,
+    scores)` arrays; ties keep row-major order, as a stable sort of all pairs
+    would.
+    """
+    matrix = np.asarray(matrix)
+    n = matrix.shape[0] if matrix.ndim == 2 else 0
+    if n < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    scores = matrix[np.triu(np.ones((n, n), dtype=bool), k=1)]
+    order = _rank(scores, top_k)
+    rows, cols = _upper_pair_positions(order, n)
+    return rows, cols, scores[order]
+
+
+def rank_neighbour_pairs(indices, scores, top_k=None):
+    """Ranks the distinct pairs of a neighbour list (`indices`/`scores`, N x k), highest score first.
+
+    A pair listed by both of its papers is kept once. Returns `(rows, cols,
+    scores)` arrays with `rows < cols`, like rank_pairs.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    scores = np.asarray(scores)
+    if indices.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    rows = np.repeat(np.arange(len(indices), dtype=np.int64), indices.shape[1])
+    cols = indices.ravel()
+    flat_scores = scores.ravel()
+    first, second = np.minimum(rows, cols), np.maximum(rows, cols)
+    _, unique = np.unique(first * len(indices) + second, return_index=True)
+    order = unique[_rank(flat_scores[unique], top_k)]
+    return first[order], second[order], flat_scores[order]
+
+
+def named_pairs(names, rows, cols, scores):
+    """Yields `(name1, name2, score)` for ranked pairs, one at a time."""
+    for i, j, score in zip(rows.tolist(), cols.tolist(), scores.tolist()):
+        yield names[i], names[j], score
@@ -0,0 +1,114 @@
+import os
+import re
+import json
+from .logger import logger
+
+PAPER_INDEX_FILENAME = 'paper_index.json'
+MAX_TITLE_LENGTH = 100
+
+
+def sanitize_filename(filename):
+    filename = filename.replace(" ", "_")
+    filename = re.sub(r'[<>":\/\\|?*]', '', filename)
+    return filename
+
+
+def safe_title(title):
+    """File name stem a paper's PDF and extracted text are saved under."""
+    return sanitize_filename(title)[:MAX_TITLE_LENGTH].strip()
+
+
+def title_slug(title):
+    """Case- and punctuation-insensitive key for matching a title against file names."""
+    return re.sub(r'[\W_]+', '', safe_title(title).lower())
+
+
+class PaperIndex:
+    """Maps paperIds and title slugs to extracted-text names.
+
+    Stored as `paper_index.json` next to the extracted texts, with one entry
+    per text (file name without `.txt`) recording the paperId, title and PDF
+    it came from. The extractor refreshes it after every run from the PDF
+    store manifest the downloader maintains, so resolving the papers of the
+    current session is a handful of dictionary lookups.
+    """
+
+    def __init__(self, folder=os.path.join('outputs', 'extracted_text')):
+        self.path = os.path.join(folder, PAPER_INDEX_FILENAME)
+        self.papers = {}
+        self.by_id = {}
+        self.by_slug = {}
+        self._stale = True
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.papers = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable paper index {self.path}: {e}")
+
+    def _rebuild_lookups(self):
+        if not self._stale:
+            return
+        self._stale = False
+        self.by_id = {}
+        self.by_slug = {}
+        for name, entry in self.papers.items():
+            if entry.get('paperId'):
+                self.by_id.setdefault(entry['paperId'], []).append(name)
+            for slug in dict.fromkeys([title_slug(name), title_slug(entry.get('title') or name)]):
+                self.by_slug.setdefault(slug, []).append(name)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.papers, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def update(self, name, paper_id=None, title=None, pdf=None):
+        entry = self.papers.setdefault(name, {'paperId': None, 'title': None, 'pdf': None})
+        entry['paperId'] = paper_id or entry['paperId']
+        entry['title'] = title or entry['title']
+        entry['pdf'] = pdf or entry['pdf']
+        self._stale = True
+
+    def retain(self, names):
+        """Drops entries whose text is no longer in `names`."""
+        self.papers = {name: entry for name, entry in self.papers.items() if name in names}
+        self._stale = True
+
+    def lookup(self, paper):
+        """Returns the text names of one paper, given as a paper dict, a title or a text name."""
+        self._rebuild_lookups()
+        if isinstance(paper, dict):
+            if paper.get('paperId') in self.by_id:
+                return self.by_id[paper['paperId']]
+            title = paper.get('title')
+            if not title:
+                return []
+            return self.by_slug.get(title_slug(title)) or [safe_title(title)]
+        if isinstance(paper, str):
+            return self.by_slug.get(title_slug(paper)) or [paper]
+        return []
+
+    def resolve(self, papers, names):
+        """Filters `names` down to the texts of `papers`, keeping their order."""
+        targets = set()
+        for paper in papers:
+            targets.update(self.lookup(paper))
+        return [name for name in names if name in targets]
+
+
+def update_paper_index(output_folder, names, pdf_entries):
+    """Records paperId/title for the texts in `names` from `{pdf_file: store manifest entry}` and saves the index."""
+    index = PaperIndex(output_folder)
+    for pdf_file, entry in pdf_entries.items():
+        name = pdf_file[:-len('.pdf')] if pdf_file.endswith('.pdf') else pdf_file
+        if name in names:
+            index.update(name, entry.get('paperId'), entry.get('title'), pdf_file)
+    for name in names:
+        if name not in index.papers:
+            index.update(name)
+    index.retain(set(names))
+    index.save()
+    return index
@@ -1,44 +1,12 @@
 import os
 from pathlib import Path
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+from .text_corpus import load_corpus_texts, use_corpus
+from .similarity_model import load_similarity_model
+from .pair_ranking import rank_pairs, named_pairs
 
 
-def load_extracted_texts(input_folder=os.path.join('outputs', 'extracted_text')):
-    texts = {}
-    
-    if not os.path.exists(input_folder):
-        return texts
-    
-    for text_file in sorted(os.listdir(input_folder)):
-        if text_file.endswith('.txt'):
-            text_path = os.path.join(input_folder, text_file)
-            try:
-                with open(text_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    paper_name = text_file.replace('.txt', '')
-                    texts[paper_name] = content
-            except Exception as e:
-                print(f"Error loading {text_file}: {str(e)}")
-    
-    return texts
-
-
-def calculate_tfidf_similarity(texts):
-    if len(texts) < 2:
-        print("Need at least 2 papers to calculate similarity")
-        return None, None, None
-    
-    paper_names = list(texts.keys())
-    paper_texts = list(texts.values())
-    
-    vectorizer = TfidfVectorizer(max_features=500, stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform(paper_texts)
-    
-    similarity_matrix = cosine_similarity(tfidf_matrix)
-    
-    return similarity_matrix, paper_names, tfidf_matrix
+def load_extracted_texts(input_folder=os.path.join('outputs', 'extracted_text'), names=None):
+    return load_corpus_texts(input_folder, names)
 
 
 def display_similarity_scores(similarity_matrix, paper_names):
@@ -49,13 +17,7 @@ def display_similarity_scores(similarity_matrix, paper_names):
     print("=" * 140)
     print(f"Total Papers: {num_papers}\n")
     
-    pairs = []
-    for i in range(num_papers):
-        for j in range(i + 1, num_papers):
-            similarity = similarity_matrix[i][j]
-            pairs.append((paper_names[i], paper_names[j], similarity))
-    
-    pairs_sorted = sorted(pairs, key=lambda x: x[2], reverse=True)
+    pairs_sorted = named_pairs(paper_names, *rank_pairs(similarity_matrix))
     
     header = "Paper 1".ljust(50) + " || " + "Paper 2".ljust(50) + " || " + "Similarity Score"
     print(header)
@@ -83,15 +45,7 @@ def save_similarity_report(similarity_matrix, paper_names, output_folder=os.path
             f.write("=" * 140 + "\n")
             f.write(f"Total Papers: {len(paper_names)}\n\n")
             
-            num_papers = len(paper_names)
-            
-            pairs = []
-            for i in range(num_papers):
-                for j in range(i + 1, num_papers):
-                    similarity = similarity_matrix[i][j]
-                    pairs.append((paper_names[i], paper_names[j], similarity))
-            
-            pairs_sorted = sorted(pairs, key=lambda x: x[2], reverse=True)
+            pairs_sorted = named_pairs(paper_names, *rank_pairs(similarity_matrix))
             
             header = "Paper 1".ljust(50) + " || " + "Paper 2".ljust(50) + " || " + "Similarity Score"
             f.write(header + "\n")
@@ -111,18 +65,18 @@ def save_similarity_report(similarity_matrix, paper_names, output_folder=os.path
         return False, str(e)
 
 
-def analyze_paper_similarity(input_folder=os.path.join('outputs', 'extracted_text')):
+def analyze_paper_similarity(input_folder=os.path.join('outputs', 'extracted_text'), refit=False):
     print("\nLoading extracted texts...")
-    texts = load_extracted_texts(input_folder)
-    
-    if len(texts) < 2:
-        print("Not enough papers to calculate similarity. Need at least 2 papers.")
-        return
-    
-    print(f"Loaded {len(texts)} papers")
-    print("Calculating TF-IDF and Cosine Similarity...")
-    
-    similarity_matrix, paper_names, tfidf_matrix = calculate_tfidf_similarity(texts)
+    with use_corpus(None, input_folder) as corpus:
+        paper_names = corpus.names()
+        if len(paper_names) < 2:
+            print("Not enough papers to calculate similarity. Need at least 2 papers.")
+            return
+        
+        print(f"Loaded {len(paper_names)} papers")
+        print("Calculating TF-IDF and Cosine Similarity...")
+        
+        similarity_matrix = load_similarity_model(corpus, refit=refit).similarity_for(paper_names)
     
     display_similarity_scores(similarity_matrix, paper_names)
     
@@ -2,9 +2,11 @@ import os
 import json
 from pathlib import Path
 from .logger import logger
+from .key_phrase_extractor import load_key_phrases, KEY_PHRASES_FILE
 
 def synthesize_papers(entities_file=os.path.join('outputs', 'entities.json'), 
-                      analysis_file=os.path.join('outputs', 'analysis', 'cross_paper_similarity.json')):
+                      analysis_file=os.path.join('outputs', 'analysis', 'cross_paper_similarity.json'),
+                      key_phrases_file=KEY_PHRASES_FILE):
     print("\nSynthesizing findings across papers...")
     
     if not os.path.exists(entities_file):
@@ -32,12 +34,19 @@ def synthesize_papers(entities_file=os.path.join('outputs', 'entities.json'),
             if name in analyzed_papers
         }
         
+        key_phrases = load_key_phrases(key_phrases_file)
+        paper_keywords = {
+            name: key_phrases[name]['frequency_keywords']
+            for name in analyzed_papers if name in key_phrases
+        }
+        
         synthesis = {
             "total_papers": len(analyzed_papers),
             "common_datasets": entities_data.get('common_entities', {}).get('datasets', {}),
             "common_methods": entities_data.get('common_entities', {}).get('methods_and_algorithms', {}),
             "key_findings": analysis_data.get('key_findings', {}),
-            "paper_details": filtered_details
+            "paper_details": filtered_details,
+            "paper_keywords": paper_keywords
         }
         
         
@@ -1,14 +1,24 @@
 import os
 import requests
 import time
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
 from pathlib import Path
 from .logger import logger
+from .pdf_store import get_pdf_store, hash_file
+from .paper_index import safe_title
 
 PDF_FOLDER = "pdf"
 PDF_DOWNLOAD_TIMEOUT = 15
 MIN_PDF_SIZE = 1000
+MAX_PDF_SIZE = 50 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_RETRIES = 3
+HEDGE_DELAY = 3
 DOWNLOAD_DELAY = 1
+MAX_DOWNLOAD_WORKERS = 8
+PER_HOST_CONCURRENCY = 2
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
@@ -19,11 +29,6 @@ def ensure_folder_exists(folder_path):
     output_path.mkdir(parents=True, exist_ok=True)
     return output_path
 
-def sanitize_filename(filename):
-    filename = filename.replace(" ", "_")
-    filename = re.sub(r'[<>":\/\\|?*]', '', filename)
-    return filename
-
 def validate_pdf_content(content, min_size=MIN_PDF_SIZE):
     if not content:
         return False
@@ -33,101 +38,332 @@ def validate_pdf_content(content, min_size=MIN_PDF_SIZE):
         return False
     return True
 
-def extract_pdf_url(paper):
-    pdf_url = None
+def extract_pdf_urls(paper):
+    """Returns every candidate PDF URL for `paper`, most preferred first."""
+    pdf_urls = []
+    
+    open_access = paper.get("openAccessPdf")
+    if isinstance(open_access, dict) and open_access.get("url"):
+        pdf_urls.append(open_access.get("url"))
+    elif isinstance(open_access, str) and open_access:
+        pdf_urls.append(open_access)
     
-    if paper.get("openAccessPdf"):
-        open_access = paper.get("openAccessPdf")
-        if isinstance(open_access, dict):
-            pdf_url = open_access.get("url")
-        elif isinstance(open_access, str):
-            pdf_url = open_access
+    arxiv_ids = [paper.get("arxivId"), (paper.get("externalIds") or {}).get("ArXiv")]
     
-    if not pdf_url and paper.get("arxivId"):
-        arxiv_id = paper.get("arxivId")
-        pdf_url = f"http://arxiv.org/pdf/{arxiv_id}.pdf"
+    url = paper.get("url")
+    if url and "arxiv.org" in url:
+        arxiv_ids.append(url.split("/abs/")[-1] if "/abs/" in url else url.split("/")[-1])
     
-    if not pdf_url and paper.get("url"):
-        url = paper.get("url")
-        if "arxiv.org" in url:
-            arxiv_id = url.split("/abs/")[-1] if "/abs/" in url else url.split("/")[-1]
-            pdf_url = f"http://arxiv.org/pdf/{arxiv_id}.pdf"
+    for arxiv_id in arxiv_ids:
+        if arxiv_id:
+            pdf_urls.append(f"http://arxiv.org/pdf/{arxiv_id}.pdf")
     
-    return pdf_url
+    return list(dict.fromkeys(pdf_urls))
 
-def download_pdf(pdf_url, title, output_folder=PDF_FOLDER):
-    if not pdf_url:
+def extract_pdf_url(paper):
+    pdf_urls = extract_pdf_urls(paper)
+    return pdf_urls[0] if pdf_urls else None
+
+class HostThrottle:
+    """Limits concurrent requests per host and spaces out request starts by `delay` seconds."""
+
+    def __init__(self, per_host=PER_HOST_CONCURRENCY, delay=DOWNLOAD_DELAY):
+        self.per_host = per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    def _host_state(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+                self._next_start[host] = 0.0
+            return self._semaphores[host]
+
+    def acquire(self, url):
+        host = urlparse(url).netloc.lower()
+        semaphore = self._host_state(host)
+        semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start[host])
+            self._next_start[host] = start_at + self.delay
+        if start_at > now:
+            time.sleep(start_at - now)
+        return host
+
+    def release(self, host):
+        self._semaphores[host].release()
+
+
+def stream_pdf_to_partial(response, partial_path, offset=0, max_size=None, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                          cancel=None):
+    """Streams `response` into `partial_path`, appending after `offset` bytes when resuming.
+
+    The `%PDF` magic is checked on the first chunk of a fresh download and the
+    transfer is aborted once `max_size` (default MAX_PDF_SIZE) is exceeded;
+    rejected bodies are deleted. Network errors, and setting the `cancel` event, leave the partial
+    file in place so a later attempt can resume it. Returns the total size,
+    or None.
+    """
+    if max_size is None:
+        max_size = MAX_PDF_SIZE
+    content_length = response.headers.get("Content-Length", "")
+    if content_length.isdigit() and offset + int(content_length) > max_size:
+        logger.warning(f"  Skipping {response.url}: {offset + int(content_length)} bytes exceeds limit")
         return None
-    
-    output_path = ensure_folder_exists(output_folder)
-    
-    safe_title = sanitize_filename(title)
-    safe_title = safe_title[:100].strip()
-    
-    pdf_file = output_path / f"{safe_title}.pdf"
-    
-    if pdf_file.exists():
-        print(f"  Already exists: {pdf_file.name}")
-        return str(pdf_file)
-    
+
+    size = offset
+    rejected = False
+    with open(partial_path, 'ab' if offset else 'wb') as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if cancel is not None and cancel.is_set():
+                return None
+            if not chunk:
+                continue
+            if size == 0 and not validate_pdf_content(chunk, min_size=0):
+                rejected = True
+                break
+            size += len(chunk)
+            if size > max_size:
+                logger.warning(f"  Aborted {response.url}: exceeds {max_size} bytes")
+                rejected = True
+                break
+            f.write(chunk)
+
+    if rejected or size < MIN_PDF_SIZE:
+        os.remove(partial_path)
+        return None
+    return size
+
+
+def fetch_pdf(pdf_url, store, cached=None, retries=None, cancel=None, max_size=None):
+    """Downloads `pdf_url` into `store`, resuming interrupted transfers with Range requests.
+
+    When `cached` holds the validators of a stored copy, a conditional GET is
+    sent and the stored blob is reused on 304. Up to `retries` attempts
+    (default DOWNLOAD_RETRIES) are made. Concurrent fetches of the same URL
+    run one at a time, and a caller that waited reuses the finished download.
+    Returns `(sha256, size)` or None.
+    """
+    with store.in_flight(pdf_url) as slot:
+        if slot.result is None:
+            slot.result = _fetch_pdf(pdf_url, store, cached, retries, cancel, max_size)
+        return slot.result
+
+
+def _fetch_pdf(pdf_url, store, cached, retries, cancel, max_size):
+    if retries is None:
+        retries = DOWNLOAD_RETRIES
+    partial = store.partial_path(pdf_url)
+
+    for attempt in range(1, retries + 1):
+        if cancel is not None and cancel.is_set():
+            return None
+        offset = partial.stat().st_size if partial.exists() else 0
+        validators = store.get_validators(pdf_url)
+        headers = dict(HEADERS)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if validators.get("etag") or validators.get("last_modified"):
+                headers["If-Range"] = validators.get("etag") or validators.get("last_modified")
+        elif cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with requests.get(pdf_url, headers=headers, timeout=PDF_DOWNLOAD_TIMEOUT, stream=True) as response:
+                if response.status_code == 304 and cached:
+                    return cached["sha256"], store.blob_path(cached["sha256"]).stat().st_size
+                if response.status_code == 416 and offset:
+                    os.remove(partial)
+                    continue
+                if response.status_code == 200:
+                    offset = 0
+                elif response.status_code != 206 or not offset:
+                    logger.error(f"  Failed: {pdf_url} (HTTP {response.status_code})")
+                    return None
+
+                store.update_validators(pdf_url, etag=response.headers.get("ETag"),
+                                        last_modified=response.headers.get("Last-Modified"))
+                size = stream_pdf_to_partial(response, partial, offset, max_size, cancel=cancel)
+        except requests.RequestException as e:
+            received = partial.stat().st_size if partial.exists() else 0
+            logger.warning(f"  Attempt {attempt}/{retries} interrupted after {received} bytes: {str(e)[:50]}")
+            continue
+
+        if size is None:
+            return None
+
+        sha = hash_file(partial)
+        store.add_blob(partial, sha)
+        store.update_validators(pdf_url, sha256=sha)
+        return sha, size
+
+    return None
+
+
+def find_cached_pdf(pdf_url, title, output_folder=PDF_FOLDER, paper_id=None):
+    store = get_pdf_store(output_folder)
+    name = safe_title(title)
+
+    known_sha = store.find(paper_id=paper_id, url=pdf_url, name=name)
+    if not known_sha:
+        return None
+
+    pdf_path = store.register(known_sha, name, title, paper_id, pdf_url)
+    logger.info(f"  Already exists: {Path(pdf_path).name}")
+    return pdf_path
+
+
+def _fetch_candidate(pdf_url, store, cached, throttle, cancel, max_size=None, retries=None):
+    host = throttle.acquire(pdf_url) if throttle else None
     try:
-        response = requests.get(pdf_url, headers=HEADERS, timeout=PDF_DOWNLOAD_TIMEOUT)
-        
-        if response.status_code == 200 and validate_pdf_content(response.content, MIN_PDF_SIZE):
-            with open(pdf_file, 'wb') as f:
-                f.write(response.content)
-            size_mb = len(response.content) / (1024 * 1024)
-            logger.info(f"  Downloaded: {pdf_file.name} ({size_mb:.2f} MB)")
-            return str(pdf_file)
-        else:
-            logger.error(f"  Failed: {title} (HTTP {response.status_code})")
+        if cancel.is_set():
             return None
-    
-    except requests.RequestException as e:
-        print(f"  Error: {str(e)[:50]}")
+        return fetch_pdf(pdf_url, store, cached, retries, cancel=cancel, max_size=max_size)
+    finally:
+        if host:
+            throttle.release(host)
+
+
+def race_pdf_urls(pdf_urls, store, revalidate=False, throttle=None, hedge_delay=None, max_size=None,
+                  retries=None):
+    """Fetches the first valid PDF among `pdf_urls` using hedged requests.
+
+    The first URL starts immediately; each fallback starts after `hedge_delay`
+    seconds (default HEDGE_DELAY) without a winner, or as soon as an earlier candidate fails. The
+    remaining requests are cancelled once one passes validation. Returns
+    `(pdf_url, sha256, size)` or None.
+    """
+    if hedge_delay is None:
+        hedge_delay = HEDGE_DELAY
+    cancel = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(pdf_urls))
+    pending = {}
+    remaining = list(pdf_urls)
+
+    def launch_next():
+        pdf_url = remaining.pop(0)
+        cached = store.get_validators(pdf_url) if revalidate else {}
+        if not (cached.get("sha256") and store.blob_path(cached["sha256"]).exists()):
+            cached = None
+        pending[executor.submit(_fetch_candidate, pdf_url, store, cached, throttle, cancel, max_size, retries)] = pdf_url
+
+    try:
+        launch_next()
+        while pending:
+            done, _ = wait(pending, timeout=hedge_delay if remaining else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_url = pending.pop(future)
+                try:
+                    fetched = future.result()
+                except OSError as e:
+                    logger.warning(f"  Error fetching {pdf_url}: {str(e)[:50]}")
+                    fetched = None
+                if fetched:
+                    return (pdf_url,) + fetched
+            if remaining:
+                launch_next()
         return None
+    finally:
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
 
-def download_all_pdfs(papers, output_folder=PDF_FOLDER):
-    pdf_paths = []
+def download_pdf(pdf_url, title, output_folder=PDF_FOLDER, paper_id=None, revalidate=False,
+                 fallback_urls=None, throttle=None, max_size=None, retries=None, hedge_delay=None):
+    if not pdf_url:
+        return None
     
-    print(f"\nDownloading {len(papers)} PDFs...\n")
+    ensure_folder_exists(output_folder)
+    store = get_pdf_store(output_folder)
     
-    downloaded = 0
-    failed = 0
+    name = safe_title(title)
     
-    for i, paper in enumerate(papers, 1):
-        title = paper.get("title", "Unknown")
-        
-        pdf_url = extract_pdf_url(paper)
-        
-        if not pdf_url:
-            print(f"{i}. {title}")
-            print(f"  No direct PDF URL available")
-            failed += 1
-            continue
-        
-        print(f"{i}. {title}")
-        pdf_path = download_pdf(pdf_url, title, output_folder)
-        
+    if not revalidate:
+        pdf_path = find_cached_pdf(pdf_url, title, output_folder, paper_id)
         if pdf_path:
-            pdf_paths.append({
-                "title": title,
-                "path": pdf_path,
-                "paperId": paper.get("paperId")
-            })
-            downloaded += 1
-        else:
-            failed += 1
-        
-        time.sleep(DOWNLOAD_DELAY)
+            return pdf_path
     
+    pdf_urls = list(dict.fromkeys([pdf_url] + list(fallback_urls or [])))
+    previous = {url: store.get_validators(url).get("sha256") for url in pdf_urls}
+    fetched = race_pdf_urls(pdf_urls, store, revalidate, throttle, hedge_delay, max_size, retries)
+
+    if fetched is None:
+        logger.error(f"  Failed: {title}")
+        return None
+
+    pdf_url, sha, size = fetched
+    pdf_path = store.register(sha, name, title, paper_id, pdf_url, replace=bool(previous[pdf_url]))
+
+    if revalidate and previous[pdf_url] == sha:
+        logger.info(f"  Not modified: {Path(pdf_path).name}")
+        return pdf_path
+
+    size_mb = size / (1024 * 1024)
+    logger.info(f"  Downloaded: {Path(pdf_path).name} ({size_mb:.2f} MB)")
+    return pdf_path
+
+def _download_paper(index, paper, output_folder, throttle, revalidate=False, max_size=None, retries=None,
+                    hedge_delay=None):
+    title = paper.get("title", "Unknown")
+    pdf_urls = extract_pdf_urls(paper)
+
+    if not pdf_urls:
+        logger.warning(f"{index}. {title}: no direct PDF URL available")
+        return None
+
+    pdf_path = download_pdf(pdf_urls[0], title, output_folder, paper.get("paperId"), revalidate,
+                            fallback_urls=pdf_urls[1:], throttle=throttle, max_size=max_size,
+                            retries=retries, hedge_delay=hedge_delay)
+
+    if not pdf_path:
+        logger.error(f"{index}. {title}: no PDF downloaded")
+        return None
+    logger.info(f"{index}. {title} -> {Path(pdf_path).name}")
+
+    return {
+        "title": title,
+        "path": pdf_path,
+        "paperId": paper.get("paperId")
+    }
+
+
+def download_all_pdfs(papers, output_folder=PDF_FOLDER, max_workers=MAX_DOWNLOAD_WORKERS,
+                      per_host=PER_HOST_CONCURRENCY, host_delay=DOWNLOAD_DELAY, revalidate=False, max_size=None,
+                      retries=None, hedge_delay=None):
+    print(f"\nDownloading {len(papers)} PDFs...\n")
+
+    throttle = HostThrottle(per_host=per_host, delay=host_delay)
+    workers = max(1, min(max_workers, len(papers)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_download_paper, i, paper, output_folder, throttle, revalidate, max_size, retries,
+                            hedge_delay)
+            for i, paper in enumerate(papers, 1)
+        ]
+        results = [future.result() for future in futures]
+
+    pruned = get_pdf_store(output_folder).prune_blobs()
+    if pruned:
+        logger.info(f"Removed {pruned} unreferenced PDF blobs")
+
+    pdf_paths = [result for result in results if result]
+    downloaded = len(pdf_paths)
+    failed = len(papers) - downloaded
+
     logger.info(f"\nDownload Summary: Downloaded: {downloaded}, Failed: {failed}, Total: {len(papers)}")
-    
+
     return pdf_paths
 
 def list_downloaded_pdfs(folder=PDF_FOLDER):
-    output_path = ensure_folder_exists(folder)
-    pdf_files = list(output_path.glob("*.pdf"))
+    ensure_folder_exists(folder)
+    pdf_files = get_pdf_store(folder).files()
     
     if not pdf_files:
         print(f"\nNo PDFs in {folder}/")
@@ -141,5 +377,5 @@ def list_downloaded_pdfs(folder=PDF_FOLDER):
     return pdf_files
 
 def get_pdf_count(folder=PDF_FOLDER):
-    output_path = ensure_folder_exists(folder)
-    return len(list(output_path.glob("*.pdf")))
+    ensure_folder_exists(folder)
+    return get_pdf_store(folder).count()
@@ -0,0 +1,242 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from .logger import logger
+
+MANIFEST_FILE = "manifest.json"
+BLOB_FOLDER = "store"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class _InFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+        self.result = None
+
+
+class PdfStore:
+    """Content-addressed PDF storage.
+
+    Each distinct PDF is kept once as `store/<sha256>.pdf`. The readable
+    `<title>.pdf` files in the folder are hard links (or copies) of those blobs,
+    and `manifest.json` maps every file name to its blob together with the
+    paperId, title and URL it was downloaded for. `by_paper_id` and `by_url`
+    index the file names by those fields.
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.blob_folder = self.folder / BLOB_FOLDER
+        self.manifest_path = self.folder / MANIFEST_FILE
+        self._lock = threading.RLock()
+        self.blobs = {}
+        self.entries = {}
+        self.validators = {}
+        self.by_paper_id = {}
+        self.by_url = {}
+        self._in_flight = {}
+        self.load()
+
+    def load(self):
+        self.blob_folder.mkdir(parents=True, exist_ok=True)
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.blobs = data.get("blobs", {})
+            self.entries = data.get("entries", {})
+            self.validators = data.get("validators", {})
+        else:
+            self._import_existing()
+        for filename, entry in self.entries.items():
+            self._index_entry(filename, entry)
+
+    def _index_entry(self, filename, entry):
+        if entry.get("paperId"):
+            self.by_paper_id.setdefault(entry["paperId"], filename)
+        if entry.get("url"):
+            self.by_url.setdefault(entry["url"], filename)
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.manifest_path.with_suffix(".json.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"blobs": self.blobs, "entries": self.entries, "validators": self.validators}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.manifest_path)
+
+    def _import_existing(self):
+        """Registers PDFs downloaded before the manifest existed."""
+        for pdf_file in sorted(self.folder.glob("*.pdf")):
+            sha = hash_file(pdf_file)
+            blob = self.blob_path(sha)
+            if not blob.exists():
+                _link_or_copy(pdf_file, blob)
+            self.blobs[sha] = {"path": f"{BLOB_FOLDER}/{sha}.pdf", "size": blob.stat().st_size}
+            self.entries[pdf_file.name] = {"sha256": sha, "title": pdf_file.stem, "paperId": None, "url": None}
+        if self.entries:
+            logger.info(f"Indexed {len(self.entries)} existing PDFs into {self.manifest_path}")
+        self.save()
+
+    def blob_path(self, sha):
+        return self.blob_folder / f"{sha}.pdf"
+
+    def partial_path(self, url):
+        """Stable location of an unfinished download of `url`, kept between attempts."""
+        return self.blob_folder / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:24]}.part"
+
+    @contextmanager
+    def in_flight(self, url):
+        """Serialises fetches of `url` within the process.
+
+        Concurrent callers share one slot per URL and take turns holding it; a
+        caller that waited finds the finished `(sha256, size)` in
+        `slot.result` and can reuse it instead of downloading into the same
+        partial file again.
+        """
+        with self._lock:
+            slot = self._in_flight.setdefault(url, _InFlight())
+            slot.users += 1
+        try:
+            with slot.lock:
+                yield slot
+        finally:
+            with self._lock:
+                slot.users -= 1
+                if not slot.users:
+                    del self._in_flight[url]
+
+    def get_validators(self, url):
+        with self._lock:
+            return dict(self.validators.get(url, {}))
+
+    def update_validators(self, url, **fields):
+        """Records ETag/Last-Modified (and the resulting sha256) last seen for `url`."""
+        with self._lock:
+            self.validators.setdefault(url, {}).update(fields)
+            self.save()
+
+    def paper_file(self, paper_id=None, url=None):
+        """Returns the file name already recorded for the paperId (or, failing that, the URL), or None."""
+        with self._lock:
+            for filename in (self.by_paper_id.get(paper_id), self.by_url.get(url)):
+                if filename and self.blob_path(self.entries[filename]["sha256"]).exists():
+                    return filename
+        return None
+
+    def find(self, paper_id=None, url=None, name=None):
+        """Returns the sha256 of a stored PDF matching the paperId, URL or file name."""
+        with self._lock:
+            filename = self.paper_file(paper_id, url)
+            if filename:
+                return self.entries[filename]["sha256"]
+            entry = self.entries.get(f"{name}.pdf") if name else None
+            if entry and self.blob_path(entry["sha256"]).exists():
+                if not paper_id or not entry.get("paperId") or entry.get("paperId") == paper_id:
+                    return entry["sha256"]
+        return None
+
+    def add_blob(self, tmp_path, sha):
+        """Moves a freshly downloaded file into the store, discarding it if the blob is already known."""
+        with self._lock:
+            blob = self.blob_path(sha)
+            if blob.exists():
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, blob)
+            self.blobs[sha] = {"path": f"{BLOB_FOLDER}/{sha}.pdf", "size": blob.stat().st_size}
+            return blob
+
+    def register(self, sha, name, title=None, paper_id=None, url=None, replace=False):
+        """Links blob `sha` into the folder as `<name>.pdf` and records it in the manifest.
+
+        A paper already stored under another file name (matched by paperId or
+        URL, e.g. after a title change) keeps that file, so every paper has a
+        single PDF in the folder. With `replace`, or for such a file, an entry
+        pointing at another blob is re-linked to `sha` (used when a
+        revalidated URL returned new content).
+        """
+        with self._lock:
+            owned = self.paper_file(paper_id, url)
+            filename = owned or f"{name}.pdf"
+            existing = self.entries.get(filename)
+            if (replace or owned) and existing and existing["sha256"] != sha:
+                existing["sha256"] = sha
+                (self.folder / filename).unlink(missing_ok=True)
+            conflict = existing["sha256"] != sha if existing else (
+                (self.folder / filename).exists() and hash_file(self.folder / filename) != sha
+            )
+            if conflict:
+                filename = f"{name}_{sha[:8]}.pdf"
+                existing = self.entries.get(filename)
+
+            entry = existing or {"sha256": sha, "title": title or name, "paperId": None, "url": None}
+            entry["paperId"] = entry.get("paperId") or paper_id
+            entry["url"] = entry.get("url") or url
+            self.entries[filename] = entry
+            self._index_entry(filename, entry)
+
+            target = self.folder / filename
+            if not target.exists():
+                _link_or_copy(self.blob_path(sha), target)
+
+            self.save()
+            return str(target)
+
+    def prune_blobs(self):
+        """Deletes blobs no manifest entry points at (replaced on revalidation, or left by losing hedged downloads).
+
+        Only call this while no download into the store is in progress, since
+        a freshly added blob is unreferenced until it is registered.
+        """
+        with self._lock:
+            referenced = {entry["sha256"] for entry in self.entries.values()}
+            stale = [path for path in self.blob_folder.glob("*.pdf") if path.stem not in referenced]
+            for path in stale:
+                try:
+                    path.unlink()
+                except OSError as e:
+                    logger.warning(f"Could not remove unreferenced blob {path.name}: {e}")
+                    continue
+                self.blobs.pop(path.stem, None)
+            self.blobs = {sha: blob for sha, blob in self.blobs.items() if sha in referenced}
+            if stale:
+                self.save()
+            return len(stale)
+
+    def files(self):
+        with self._lock:
+            return [self.folder / name for name in sorted(self.entries) if (self.folder / name).exists()]
+
+    def count(self):
+        return len(self.files())
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_pdf_store(folder):
+    key = os.path.abspath(folder)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = PdfStore(folder)
+        return _stores[key]
@@ -1,23 +1,78 @@
 import os
+import json
+import time
+import multiprocessing
+from multiprocessing.connection import wait
 import PyPDF2
 from pathlib import Path
 from .logger import logger
+from .pdf_store import hash_file, get_pdf_store, MANIFEST_FILE
+from .text_corpus import open_corpus
+from .paper_index import update_paper_index
+
+EXTRACTOR_VERSION = f"pypdf2-{getattr(PyPDF2, '__version__', 'unknown')}/1"
+MANIFEST_FILENAME = 'extraction_manifest.json'
+DOCUMENT_TIMEOUT = 120
+PAGE_TIMEOUT = 30
+WATCHDOG_POLL_INTERVAL = 0.2
+SCAN_PROBE_PAGES = 3
+SCAN_MIN_CHARS_PER_PAGE = 20
 
 
 def ensure_folder_exists(folder_path):
     Path(folder_path).mkdir(parents=True, exist_ok=True)
 
 
-def extract_text_from_pdf(pdf_path):
-    text_content = []
+def iter_pdf_pages(pdf_path, max_pages=None, on_page=None):
+    """Yields `(page_num, text)` for each page of `pdf_path` as soon as it is parsed.
+
+    Pages are numbered from 1; iteration stops after `max_pages` pages when given.
+    """
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page_num, page in enumerate(pdf_reader.pages, 1):
+            if max_pages and page_num > max_pages:
+                return
+            if on_page:
+                on_page(page_num)
+            yield page_num, page.extract_text() or ''
+
+
+def probe_text_layer(pdf_path, sample_pages=SCAN_PROBE_PAGES, on_page=None):
+    """Samples a few evenly spaced pages and classifies the PDF as 'text' or 'image-only'.
+
+    Scanned PDFs without a text layer return almost nothing from
+    `extract_text`, so a handful of pages is enough to tell them apart.
+    """
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        num_pages = len(pdf_reader.pages)
+        if num_pages == 0:
+            return 'image-only'
+        
+        step = (num_pages - 1) / max(sample_pages - 1, 1)
+        sampled = sorted({round(i * step) for i in range(sample_pages)})
+        
+        chars = 0
+        for index in sampled:
+            if on_page:
+                on_page(index + 1)
+            chars += len(''.join((pdf_reader.pages[index].extract_text() or '').split()))
+    
+    return 'text' if chars >= SCAN_MIN_CHARS_PER_PAGE * len(sampled) else 'image-only'
+
+
+def format_page_text(page_num, page_text):
+    return f"--- Page {page_num} ---\n{page_text}\n"
+
+
+def extract_text_from_pdf(pdf_path, on_page=None, max_pages=None):
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                if page_text.strip():
-                    text_content.append(f"--- Page {page_num + 1} ---\n{page_text}\n")
-        return ''.join(text_content)
+        return ''.join(
+            format_page_text(page_num, page_text)
+            for page_num, page_text in iter_pdf_pages(pdf_path, max_pages, on_page)
+            if page_text.strip()
+        )
     except Exception as e:
         return f"Error extracting text from {pdf_path}: {str(e)}"
 
@@ -33,29 +88,242 @@ def save_extracted_text(text_content, output_filename, output_folder=os.path.joi
         return False, str(e)
 
 
-def extract_all_pdfs_text(pdf_folder='pdf', output_folder=os.path.join('outputs', 'extracted_text')):
+def load_extraction_manifest(output_folder):
+    manifest_path = os.path.join(output_folder, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable extraction manifest: {e}")
+        return {}
+
+
+def save_extraction_manifest(manifest, output_folder):
+    manifest_path = os.path.join(output_folder, MANIFEST_FILENAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def pdf_fingerprint(pdf_path, previous=None):
+    """Returns size, mtime and sha256 of `pdf_path`, reusing the previous hash when size and mtime match."""
+    stat = os.stat(pdf_path)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime:
+        fingerprint['sha256'] = previous.get('sha256')
+    else:
+        fingerprint['sha256'] = hash_file(pdf_path)
+    return fingerprint
+
+
+def is_extraction_current(entry, fingerprint, output_folder, max_pages=None, document_timeout=DOCUMENT_TIMEOUT,
+                          page_timeout=PAGE_TIMEOUT):
+    """Whether `entry` still describes the PDF; a recorded timeout only counts if the budgets have not grown since."""
+    if not entry or entry.get('extractor') != EXTRACTOR_VERSION:
+        return False
+    if entry.get('max_pages') != max_pages:
+        return False
+    if entry.get('sha256') != fingerprint['sha256']:
+        return False
+    if entry.get('status') == 'Timeout':
+        return (entry.get('document_timeout') is not None and document_timeout <= entry['document_timeout']
+                and entry.get('page_timeout') is not None and page_timeout <= entry['page_timeout'])
+    if entry.get('status') == 'Scanned':
+        return True
+    return os.path.exists(os.path.join(output_folder, entry['text_file']))
+
+
+def remove_stale_text(output_folder, text_file):
+    """Deletes the text extracted from an earlier version of a PDF that could not be extracted now."""
+    output_path = os.path.join(output_folder, text_file)
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+
+def extract_pdf_to_file(pdf_folder, pdf_file, output_folder, on_page=None, max_pages=None):
+    """Extracts one PDF page by page straight into its text file; runs inside a watchdog worker process."""
+    pdf_path = os.path.join(pdf_folder, pdf_file)
+    output_filename = pdf_file.replace('.pdf', '.txt')
+    output_path = os.path.join(output_folder, output_filename)
+    tmp_path = output_path + '.tmp'
+    
+    start = time.perf_counter()
+    try:
+        text_layer = probe_text_layer(pdf_path, on_page=on_page)
+    except Exception:
+        text_layer = 'text'
+    
+    if text_layer == 'image-only':
+        remove_stale_text(output_folder, output_filename)
+        return {'pdf': pdf_file, 'text_file': output_filename, 'status': 'Scanned', 'text_layer': text_layer,
+                'error': 'no text layer (image-only PDF), full extraction skipped', 'seconds': time.perf_counter() - start}
+    
+    try:
+        ensure_folder_exists(output_folder)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            try:
+                for page_num, page_text in iter_pdf_pages(pdf_path, max_pages, on_page):
+                    if page_text.strip():
+                        f.write(format_page_text(page_num, page_text))
+            except Exception as e:
+                f.seek(0)
+                f.truncate()
+                f.write(f"Error extracting text from {pdf_path}: {str(e)}")
+        os.replace(tmp_path, output_path)
+    except OSError as e:
+        return {'pdf': pdf_file, 'text_file': output_filename, 'status': 'Failed', 'error': str(e),
+                'seconds': time.perf_counter() - start}
+    elapsed = time.perf_counter() - start
+    
+    file_size = os.path.getsize(output_path) / 1024
+    return {'pdf': pdf_file, 'text_file': output_filename, 'status': 'Success', 'text_layer': text_layer,
+            'size_kb': file_size, 'seconds': elapsed}
+
+
+def _extraction_worker(pdf_folder, pdf_file, output_folder, max_pages, conn):
+    result = extract_pdf_to_file(pdf_folder, pdf_file, output_folder, max_pages=max_pages,
+                                 on_page=lambda page_num: conn.send(('page', page_num)))
+    conn.send(('done', result))
+    conn.close()
+
+
+def run_extraction_watchdog(pdf_folder, pdf_files, output_folder, workers, document_timeout=DOCUMENT_TIMEOUT,
+                            page_timeout=PAGE_TIMEOUT, max_pages=None):
+    """Extracts each PDF in its own worker process, at most `workers` at a time.
+
+    Workers report every page they start. A worker that runs longer than
+    `document_timeout` seconds in total, or `page_timeout` seconds on one
+    page, is killed and its PDF is reported with status 'Timeout'.
+    """
+    context = multiprocessing.get_context()
+    queue = list(pdf_files)
+    running = {}
+    results = {}
+    
+    def finish(conn, result):
+        state = running.pop(conn)
+        state['process'].join(timeout=1)
+        conn.close()
+        tmp_path = os.path.join(output_folder, result['text_file'] + '.tmp')
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        results[state['pdf']] = result
+    
+    while queue or running:
+        while queue and len(running) < workers:
+            pdf_file = queue.pop(0)
+            parent_conn, child_conn = context.Pipe(duplex=False)
+            process = context.Process(target=_extraction_worker, args=(pdf_folder, pdf_file, output_folder, max_pages, child_conn),
+                                      daemon=True)
+            process.start()
+            child_conn.close()
+            now = time.monotonic()
+            running[parent_conn] = {'pdf': pdf_file, 'process': process, 'started': now, 'page_started': now, 'page': 0}
+        
+        for conn in wait(list(running), timeout=WATCHDOG_POLL_INTERVAL):
+            state = running[conn]
+            try:
+                while conn.poll():
+                    kind, payload = conn.recv()
+                    if kind == 'page':
+                        state['page'] = payload
+                        state['page_started'] = time.monotonic()
+                    else:
+                        finish(conn, payload)
+                        break
+            except EOFError:
+                state['process'].join(timeout=1)
+                exitcode = state['process'].exitcode
+                finish(conn, {'pdf': state['pdf'], 'text_file': state['pdf'].replace('.pdf', '.txt'), 'status': 'Failed',
+                              'error': f"Extraction worker exited unexpectedly (exit code {exitcode})",
+                              'seconds': time.monotonic() - state['started']})
+        
+        now = time.monotonic()
+        for conn, state in list(running.items()):
+            if now - state['started'] > document_timeout:
+                reason = f"exceeded {document_timeout}s document budget"
+            elif now - state['page_started'] > page_timeout:
+                reason = f"exceeded {page_timeout}s budget on page {state['page']}"
+            else:
+                continue
+            state['process'].kill()
+            finish(conn, {'pdf': state['pdf'], 'text_file': state['pdf'].replace('.pdf', '.txt'), 'status': 'Timeout',
+                          'error': reason, 'seconds': now - state['started']})
+    
+    return [results[pdf_file] for pdf_file in pdf_files]
+
+
+def extract_all_pdfs_text(pdf_folder='pdf', output_folder=os.path.join('outputs', 'extracted_text'), workers=None,
+                          force=False, document_timeout=DOCUMENT_TIMEOUT, page_timeout=PAGE_TIMEOUT, max_pages=None):
     ensure_folder_exists(output_folder)
     results = []
     
     if not os.path.exists(pdf_folder):
         return results
     
-    for pdf_file in os.listdir(pdf_folder):
-        if pdf_file.endswith('.pdf'):
-            pdf_path = os.path.join(pdf_folder, pdf_file)
-            output_filename = pdf_file.replace('.pdf', '.txt')
-            
-            print(f"Extracting text from {pdf_file}...")
-            text_content = extract_text_from_pdf(pdf_path)
-            
-            success, message = save_extracted_text(text_content, output_filename, output_folder)
-            
-            if success:
-                file_size = os.path.getsize(message) / 1024
-                results.append({'pdf': pdf_file, 'text_file': output_filename, 'status': 'Success', 'size_kb': file_size})
-                logger.info(f"  Extracted to {output_filename} ({file_size:.2f} KB)")
-            else:
-                results.append({'pdf': pdf_file, 'text_file': output_filename, 'status': 'Failed', 'error': message})
-                logger.error(f"  Failed: {message}")
+    manifest = {} if force else load_extraction_manifest(output_folder)
+    pdf_files = sorted(f for f in os.listdir(pdf_folder) if f.endswith('.pdf'))
+    
+    fingerprints = {}
+    unchanged = {}
+    for pdf_file in pdf_files:
+        fingerprint = pdf_fingerprint(os.path.join(pdf_folder, pdf_file), manifest.get(pdf_file))
+        fingerprints[pdf_file] = fingerprint
+        if is_extraction_current(manifest.get(pdf_file), fingerprint, output_folder, max_pages, document_timeout,
+                                 page_timeout):
+            text_file = manifest[pdf_file]['text_file']
+            if manifest[pdf_file].get('status') == 'Timeout':
+                unchanged[pdf_file] = {'pdf': pdf_file, 'text_file': text_file, 'status': 'Timeout',
+                                       'error': 'timed out previously and has not changed'}
+                continue
+            if manifest[pdf_file].get('status') == 'Scanned':
+                unchanged[pdf_file] = {'pdf': pdf_file, 'text_file': text_file, 'status': 'Scanned',
+                                       'text_layer': 'image-only', 'error': 'no text layer (image-only PDF)'}
+                continue
+            file_size = os.path.getsize(os.path.join(output_folder, text_file)) / 1024
+            unchanged[pdf_file] = {'pdf': pdf_file, 'text_file': text_file, 'status': 'Unchanged',
+                                   'text_layer': manifest[pdf_file].get('text_layer', 'text'), 'size_kb': file_size}
+    
+    pending = [f for f in pdf_files if f not in unchanged]
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    
+    print(f"Extracting text from {len(pending)} new or modified PDFs ({len(unchanged)} unchanged) "
+          f"with {max(workers, 1)} worker(s)...")
+    extracted = run_extraction_watchdog(pdf_folder, pending, output_folder, max(workers, 1), document_timeout, page_timeout,
+                                        max_pages)
+    extracted = dict(zip(pending, extracted))
+    
+    for pdf_file, result in extracted.items():
+        if result['status'] == 'Success':
+            manifest[pdf_file] = dict(fingerprints[pdf_file], text_file=result['text_file'], extractor=EXTRACTOR_VERSION,
+                                      max_pages=max_pages, text_layer=result['text_layer'])
+            logger.info(f"  Extracted {result['pdf']} to {result['text_file']} ({result['size_kb']:.2f} KB) in {result['seconds']:.2f}s")
+        elif result['status'] == 'Timeout':
+            manifest[pdf_file] = dict(fingerprints[pdf_file], text_file=result['text_file'], extractor=EXTRACTOR_VERSION,
+                                      max_pages=max_pages, status='Timeout', document_timeout=document_timeout,
+                                      page_timeout=page_timeout)
+            remove_stale_text(output_folder, result['text_file'])
+            logger.error(f"  Timed out: {result['pdf']}: {result['error']}")
+        elif result['status'] == 'Scanned':
+            manifest[pdf_file] = dict(fingerprints[pdf_file], text_file=result['text_file'], extractor=EXTRACTOR_VERSION,
+                                      max_pages=max_pages, text_layer='image-only', status='Scanned')
+            logger.warning(f"  Skipped {result['pdf']}: {result['error']}")
+        else:
+            manifest.pop(pdf_file, None)
+            remove_stale_text(output_folder, result['text_file'])
+            logger.error(f"  Failed: {result['pdf']}: {result['error']}")
+    
+    for pdf_file in unchanged:
+        manifest[pdf_file]['mtime'] = fingerprints[pdf_file]['mtime']
+    
+    save_extraction_manifest({name: entry for name, entry in manifest.items() if name in fingerprints}, output_folder)
+    with open_corpus(output_folder) as corpus:
+        names = set(corpus.names())
+    pdf_entries = get_pdf_store(pdf_folder).entries if os.path.exists(os.path.join(pdf_folder, MANIFEST_FILE)) else {}
+    update_paper_index(output_folder, names, pdf_entries)
     
+    results = [unchanged.get(pdf_file) or extracted[pdf_file] for pdf_file in pdf_files]
     return results
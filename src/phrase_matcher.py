@@ -0,0 +1,85 @@
+import re
+from functools import lru_cache
+
+_WORD_CHAR = re.compile(r'\w')
+
+
+def _is_word_boundary(text, index):
+    before = index > 0 and _WORD_CHAR.match(text[index - 1]) is not None
+    after = index < len(text) and _WORD_CHAR.match(text[index]) is not None
+    return before != after
+
+
+def _trie_pattern(node):
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    return f'(?:{body})?' if '' in node else body
+
+
+class PhraseMatcher:
+    """Finds every occurrence of a fixed set of phrases in a single pass over a text.
+
+    The phrases are compiled once into a trie-shaped regex inside a lookahead,
+    so the scan costs one pass regardless of how many phrases there are. At
+    each position the regex reports the longest phrase; shorter phrases that
+    are prefixes of it are emitted from a precomputed table. Like a separate
+    `re.finditer` per phrase, occurrences of the same phrase never overlap.
+    With `word_boundary`, a phrase only matches where `\\b<phrase>\\b` would.
+    """
+
+    def __init__(self, phrases, lowercase=False, word_boundary=False):
+        self.word_boundary = word_boundary
+        self.phrases = list(phrases)
+        self._distinct = set(self.phrases)
+        self._by_key = {}
+        for phrase in dict.fromkeys(self.phrases):
+            key = phrase.lower() if lowercase else phrase
+            if key:
+                self._by_key.setdefault(key, []).append(phrase)
+
+        trie = {}
+        for key in self._by_key:
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        self._prefixes = {
+            key: [key[:i] for i in range(1, len(key) + 1) if key[:i] in self._by_key]
+            for key in self._by_key
+        }
+        boundary = r'\b' if word_boundary else ''
+        self._regex = re.compile(f'(?={boundary}({_trie_pattern(trie)}){boundary})') if self._by_key else None
+
+    def finditer(self, text):
+        """Yields `(phrase, start, end)` for every occurrence, ordered by start position."""
+        if self._regex is None:
+            return
+        last_end = {}
+        for match in self._regex.finditer(text):
+            start = match.start()
+            for key in self._prefixes[match.group(1)]:
+                if start < last_end.get(key, 0):
+                    continue
+                if self.word_boundary and not _is_word_boundary(text, start + len(key)):
+                    continue
+                last_end[key] = start + len(key)
+                for phrase in self._by_key[key]:
+                    yield phrase, start, start + len(key)
+
+    def present(self, text):
+        """Returns the set of phrases that occur at least once in `text`."""
+        found = set()
+        for phrase, _, _ in self.finditer(text):
+            found.add(phrase)
+            if len(found) == len(self._distinct):
+                break
+        return found
+
+
+@lru_cache(maxsize=32)
+def get_phrase_matcher(phrases, lowercase=False, word_boundary=False):
+    """Returns a cached PhraseMatcher for a tuple of phrases, so each phrase list is compiled once."""
+    return PhraseMatcher(phrases, lowercase, word_boundary)
@@ -0,0 +1,227 @@
+import os
+import json
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+from .logger import logger
+
+SIMILARITY_MODEL_FOLDER = os.path.join('outputs', 'analysis', 'similarity_model')
+MODEL_VERSION = 2
+MAX_FEATURES = 500
+REFIT_GROWTH = 2.0
+MIN_COVERAGE_RATIO = 0.6
+OOV_REFIT_SHARE = 0.5
+NEIGHBOUR_BLOCK_SIZE = 1024
+
+
+def top_k_neighbours(tfidf, k, block_size=NEIGHBOUR_BLOCK_SIZE):
+    """Each row's `k` most similar other rows of an L2-normalized sparse matrix.
+
+    Works through `block_size` rows at a time, so only a block x N slice of
+    scores is ever dense. Returns `(indices, scores)`, both N x k, best first.
+    """
+    n_rows = tfidf.shape[0]
+    k = min(k, n_rows - 1)
+    indices = np.zeros((n_rows, max(k, 0)), dtype=np.int32)
+    scores = np.zeros((n_rows, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return indices, scores
+
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        block = (tfidf[start:stop] @ tfidf.T).toarray()
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        indices[start:stop] = np.take_along_axis(top, order, axis=1)
+        scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+    return indices, scores
+
+
+class SimilarityModel:
+    """Persisted TF-IDF model of the extracted-text corpus.
+
+    A full fit picks the vocabulary exactly as
+    `TfidfVectorizer(max_features=500, stop_words='english')` would and stores
+    the raw document-term counts and the document frequencies as sparse/1-D
+    arrays. Later updates count only new or changed papers against the fixed
+    vocabulary and adjust the document frequencies, so their cost depends on
+    the number of changed papers. A refit happens on request, once the
+    corpus has grown `REFIT_GROWTH` times beyond the size it was last fitted
+    on, or when the new papers no longer fit the vocabulary: one of them
+    gets an empty row, or at least `OOV_REFIT_SHARE` of them have less than
+    `MIN_COVERAGE_RATIO` times the in-vocabulary share of words the fitted
+    papers had.
+
+    No corpus-wide similarity matrix is kept: similarities and top-k
+    neighbours are computed for the requested papers only, from their sparse
+    TF-IDF rows under the current IDF weights.
+    """
+
+    def __init__(self, folder=SIMILARITY_MODEL_FOLDER):
+        self.folder = folder
+        self.names = []
+        self.fingerprints = {}
+        self.vocabulary = []
+        self.fitted_docs = 0
+        self.coverage = 0.0
+        self.df = np.zeros(0, dtype=np.int64)
+        self.counts = sp.csr_matrix((0, 0), dtype=np.int64)
+        self._load()
+
+    def _path(self, filename):
+        return os.path.join(self.folder, filename)
+
+    def _load(self):
+        if not os.path.exists(self._path('model.json')):
+            return
+        try:
+            with open(self._path('model.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != MODEL_VERSION:
+                return
+            counts = sp.load_npz(self._path('counts.npz')).tocsr()
+            df = np.load(self._path('df.npy'))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Refitting unreadable similarity model in {self.folder}: {e}")
+            return
+        self.names = meta['names']
+        self.fingerprints = meta['fingerprints']
+        self.vocabulary = meta['vocabulary']
+        self.fitted_docs = meta['fitted_docs']
+        self.coverage = meta['coverage']
+        self.counts, self.df = counts, df
+
+    def save(self):
+        os.makedirs(self.folder, exist_ok=True)
+        sp.save_npz(self._path('counts.tmp.npz'), self.counts)
+        os.replace(self._path('counts.tmp.npz'), self._path('counts.npz'))
+        with open(self._path('df.npy.tmp'), 'wb') as f:
+            np.save(f, self.df)
+        os.replace(self._path('df.npy.tmp'), self._path('df.npy'))
+        meta = {'version': MODEL_VERSION, 'names': self.names, 'fingerprints': self.fingerprints,
+                'vocabulary': self.vocabulary, 'fitted_docs': self.fitted_docs, 'coverage': self.coverage}
+        with open(self._path('model.json.tmp'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(self._path('model.json.tmp'), self._path('model.json'))
+
+    def idf(self):
+        n_docs = len(self.names)
+        return np.log((1 + n_docs) / (1 + self.df)) + 1
+
+    def tfidf(self, rows=None):
+        """L2-normalized TF-IDF rows (all documents by default) under the current document frequencies."""
+        counts = self.counts if rows is None else self.counts[rows]
+        return normalize(sp.csr_matrix(counts.multiply(self.idf()), dtype=np.float64))
+
+    @staticmethod
+    def _tokenize(texts, names, lengths):
+        """Yields the analyzed words of each text, recording how many there were in `lengths`."""
+        analyze = CountVectorizer(stop_words='english').build_analyzer()
+        for name in names:
+            words = analyze(texts[name])
+            lengths.append(len(words))
+            yield words
+
+    def fit(self, texts, fingerprints):
+        """Refits the vocabulary and every row on `texts` (`{paper_name: text}`)."""
+        self.names = list(texts)
+        self.fingerprints = {name: fingerprints[name] for name in self.names}
+        lengths = []
+        vectorizer = CountVectorizer(analyzer=lambda words: words, max_features=MAX_FEATURES, dtype=np.int64)
+        try:
+            self.counts = vectorizer.fit_transform(self._tokenize(texts, self.names, lengths)).tocsr()
+            self.vocabulary = vectorizer.get_feature_names_out().tolist()
+        except ValueError:
+            self.counts = sp.csr_matrix((len(self.names), 0), dtype=np.int64)
+            self.vocabulary = []
+        self.df = np.bincount(self.counts.indices, minlength=len(self.vocabulary)).astype(np.int64)
+        self.fitted_docs = len(self.names)
+        coverage = self._coverage(self.counts, lengths)
+        self.coverage = float(coverage.mean()) if len(coverage) else 0.0
+        return self
+
+    @staticmethod
+    def _coverage(counts, lengths):
+        """Share of each non-empty document's words that are in the vocabulary."""
+        lengths = np.asarray(lengths, dtype=np.float64)
+        in_vocabulary = np.asarray(counts.sum(axis=1), dtype=np.float64).ravel()
+        return in_vocabulary[lengths > 0] / lengths[lengths > 0]
+
+    def _count(self, texts, names):
+        """Counts `texts` against the fixed vocabulary; returns the counts and each text's coverage."""
+        if not self.vocabulary:
+            return sp.csr_matrix((len(names), 0), dtype=np.int64), np.zeros(len(names))
+        lengths = []
+        vectorizer = CountVectorizer(analyzer=lambda words: words, vocabulary=self.vocabulary, dtype=np.int64)
+        counts = vectorizer.transform(self._tokenize(texts, names, lengths)).tocsr()
+        return counts, self._coverage(counts, lengths)
+
+    def _out_of_vocabulary(self, coverage):
+        """Whether newly counted papers are too far from the vocabulary to append without a refit."""
+        if not len(coverage):
+            return False
+        poor = coverage < MIN_COVERAGE_RATIO * self.coverage
+        return bool((coverage == 0).any() or poor.mean() >= OOV_REFIT_SHARE)
+
+    def _remove(self, names):
+        keep = [i for i, name in enumerate(self.names) if name not in names]
+        removed = self.counts[[i for i, name in enumerate(self.names) if name in names]]
+        self.df = self.df - np.bincount(removed.indices, minlength=len(self.vocabulary))
+        self.counts = self.counts[keep]
+        self.names = [self.names[i] for i in keep]
+        for name in names:
+            self.fingerprints.pop(name, None)
+
+    def _append(self, new_names, new_counts, fingerprints):
+        self.names.extend(new_names)
+        self.fingerprints.update({name: fingerprints[name] for name in new_names})
+        self.counts = sp.vstack([self.counts, new_counts], format='csr')
+        self.df = self.df + np.bincount(new_counts.indices, minlength=len(self.vocabulary))
+
+    def update(self, corpus, refit=False):
+        """Brings the model in line with `corpus`; returns the number of papers (re)counted."""
+        names = corpus.names()
+        fingerprints = {name: corpus.fingerprint(name) for name in names}
+        stale = {name for name in self.names if fingerprints.get(name) != self.fingerprints.get(name)}
+        added = [name for name in names if name not in self.fingerprints or name in stale]
+
+        refit = refit or not self.fitted_docs or len(names) > REFIT_GROWTH * self.fitted_docs
+        if not refit:
+            if not stale and not added:
+                return 0
+            new_counts, coverage = self._count(corpus.texts(added), added)
+            refit = self._out_of_vocabulary(coverage)
+        if refit:
+            self.fit(corpus.texts(names), fingerprints)
+            self.save()
+            return len(names)
+
+        self._remove(stale)
+        self._append(added, new_counts, fingerprints)
+        self.save()
+        return len(added)
+
+    def _rows(self, names):
+        positions = {name: i for i, name in enumerate(self.names)}
+        return [positions[name] for name in names]
+
+    def similarity_for(self, names):
+        """Returns the cosine similarity matrix of `names`, in that order, computed from their TF-IDF rows."""
+        tfidf = self.tfidf(self._rows(names))
+        return (tfidf @ tfidf.T).toarray()
+
+    def neighbours_for(self, names, k, block_size=NEIGHBOUR_BLOCK_SIZE):
+        """Top-`k` neighbours among `names` for each of them, as positions into `names` (see top_k_neighbours)."""
+        return top_k_neighbours(self.tfidf(self._rows(names)), k, block_size)
+
+
+def load_similarity_model(corpus, folder=SIMILARITY_MODEL_FOLDER, refit=False):
+    """Opens the persisted model and updates it with the papers added to `corpus` since the last run."""
+    model = SimilarityModel(folder)
+    counted = model.update(corpus, refit)
+    if counted:
+        print(f"Similarity model: counted {counted} new or changed papers ({len(model.names)} in the corpus)")
+    return model
@@ -0,0 +1,108 @@
+import os
+import json
+import uuid
+import numpy as np
+from .pair_ranking import rank_pairs, rank_neighbour_pairs, named_pairs
+
+SIMILARITY_MATRIX_PREFIX = 'similarity_matrix'
+
+
+def save_similarity_matrix(matrix, output_folder):
+    """Writes `matrix` as a float32 `.npy` file in `output_folder` and returns its file name.
+
+    Every save gets a fresh file name, so the analysis JSON keeps pointing
+    at a complete matrix until it is replaced; call remove_stale_matrices
+    once the new JSON is in place.
+    """
+    filename = f"{SIMILARITY_MATRIX_PREFIX}_{uuid.uuid4().hex[:12]}.npy"
+    tmp_path = os.path.join(output_folder, filename + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.asarray(matrix, dtype=np.float32))
+    os.replace(tmp_path, os.path.join(output_folder, filename))
+    return filename
+
+
+def remove_stale_matrices(output_folder, keep=None):
+    """Deletes the similarity matrices in `output_folder` other than `keep`.
+
+    On POSIX a reader that still has an old matrix memory-mapped keeps its
+    data after the unlink. On Windows a mapped file cannot be deleted, so it
+    is skipped and removed by a later call.
+    """
+    for name in os.listdir(output_folder):
+        if name.startswith(SIMILARITY_MATRIX_PREFIX) and name.endswith('.npy') and name != keep:
+            try:
+                os.remove(os.path.join(output_folder, name))
+            except OSError:
+                pass
+
+
+class SimilarityStore:
+    """Read access to a cross-paper analysis without parsing a matrix out of JSON.
+
+    The analysis JSON only carries the paper names, key findings and the
+    name of the float32 `.npy` matrix next to it, which is memory-mapped so
+    row, pair and top-k reads touch just the slices they need. Analyses in
+    neighbour mode are served from their neighbour lists; older files with
+    an inline `similarity_matrix` still load.
+    """
+
+    def __init__(self, analysis_file):
+        with open(analysis_file, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.paper_names = self.meta.get('paper_names', [])
+        self.positions = {name: i for i, name in enumerate(self.paper_names)}
+        self.neighbours = self.meta.get('neighbours') if self.meta.get('similarity_mode') == 'neighbours' else None
+
+        matrix_file = self.meta.get('similarity_file')
+        if matrix_file:
+            self.matrix = np.load(os.path.join(os.path.dirname(analysis_file), matrix_file), mmap_mode='r')
+        elif self.meta.get('similarity_matrix'):
+            self.matrix = np.asarray(self.meta.pop('similarity_matrix'), dtype=np.float32)
+        else:
+            self.matrix = None
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def pair(self, paper1, paper2):
+        """Similarity of two papers, or None if it is not stored."""
+        i, j = self.positions[paper1], self.positions[paper2]
+        if self.matrix is not None:
+            return float(self.matrix[i, j])
+        if self.neighbours is not None:
+            for neighbour, score in self.neighbours[i] + self.neighbours[j]:
+                if neighbour in (i, j):
+                    return score
+        return None
+
+    def row(self, paper):
+        """`[(other_paper, score)]` for every other paper (or every stored neighbour), highest score first."""
+        return self.top_k(paper, len(self.paper_names))
+
+    def top_k(self, paper, k):
+        """The `k` papers most similar to `paper`, highest score first."""
+        i = self.positions[paper]
+        if self.matrix is None:
+            neighbours = self.neighbours[i] if self.neighbours is not None else []
+            return [(self.paper_names[j], score) for j, score in neighbours[:k]]
+
+        scores = np.array(self.matrix[i], dtype=np.float32)
+        scores[i] = -np.inf
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.paper_names[j], float(scores[j])) for j in top]
+
+    def ranked_pairs(self, top_k=None):
+        """Yields `(paper1, paper2, score)` for the distinct stored pairs, highest score first (see rank_pairs)."""
+        if self.matrix is not None:
+            ranking = rank_pairs(self.matrix, top_k)
+        elif self.neighbours:
+            neighbours = np.asarray(self.neighbours, dtype=np.float64).reshape(len(self.neighbours), -1, 2)
+            ranking = rank_neighbour_pairs(neighbours[:, :, 0].astype(np.int64), neighbours[:, :, 1], top_k)
+        else:
+            ranking = rank_pairs([], top_k)
+        return named_pairs(self.paper_names, *ranking)
@@ -0,0 +1,284 @@
+import os
+import json
+import mmap
+import zlib
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from .logger import logger
+
+PACK_FILENAME = 'corpus.pack'
+INDEX_FILENAME = 'corpus_index.json'
+COMPRESSION_LEVEL = 6
+COMPACT_RATIO = 0.5
+
+
+class TextCorpus:
+    """Packed, compressed store of the extracted texts in one folder.
+
+    Every document is a zlib-compressed segment appended to `corpus.pack`, and
+    `corpus_index.json` maps the paper name (text file name without `.txt`)
+    to its offset and length, plus the size and mtime of the `.txt` file it
+    was packed from. Reads go through a memory map of the pack, so loading
+    any subset costs one open and one slice per document.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.pack_path = os.path.join(folder, PACK_FILENAME)
+        self.index_path = os.path.join(folder, INDEX_FILENAME)
+        self.index = self._load_index()
+        self._file = None
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path) or not os.path.exists(self.pack_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Rebuilding unreadable corpus index {self.index_path}: {e}")
+            return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def sync(self):
+        """Packs new or modified `.txt` files from the folder and forgets deleted ones."""
+        if not os.path.isdir(self.folder):
+            return self
+
+        sources = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.txt'):
+                    stat = entry.stat()
+                    sources[entry.name[:-len('.txt')]] = (stat.st_size, stat.st_mtime)
+
+        changed = sorted(
+            name for name, (size, mtime) in sources.items()
+            if name not in self.index
+            or self.index[name]['source_size'] != size
+            or self.index[name]['source_mtime'] != mtime
+        )
+        removed = [name for name in self.index if name not in sources]
+
+        if not self.index and os.path.exists(self.pack_path):
+            self.close()
+            os.remove(self.pack_path)
+
+        if changed:
+            self.close()
+            with open(self.pack_path, 'ab') as pack:
+                for name in changed:
+                    try:
+                        with open(os.path.join(self.folder, name + '.txt'), 'r', encoding='utf-8') as f:
+                            segment = zlib.compress(f.read().encode('utf-8'), COMPRESSION_LEVEL)
+                    except OSError as e:
+                        logger.error(f"Error packing {name}.txt: {e}")
+                        continue
+                    size, mtime = sources[name]
+                    self.index[name] = {'offset': pack.tell(), 'length': len(segment),
+                                        'source_size': size, 'source_mtime': mtime}
+                    pack.write(segment)
+
+        for name in removed:
+            del self.index[name]
+
+        if changed or removed:
+            self._save_index()
+            self._compact_if_sparse()
+        return self
+
+    def _compact_if_sparse(self):
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        live_size = sum(entry['length'] for entry in self.index.values())
+        if pack_size and live_size < pack_size * COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """Rewrites the pack with only the live segments, in name order."""
+        self.close()
+        tmp_path = self.pack_path + '.tmp'
+        with open(self.pack_path, 'rb') as old_pack, open(tmp_path, 'wb') as new_pack:
+            for name in sorted(self.index):
+                entry = self.index[name]
+                old_pack.seek(entry['offset'])
+                segment = old_pack.read(entry['length'])
+                entry['offset'] = new_pack.tell()
+                new_pack.write(segment)
+        os.replace(tmp_path, self.pack_path)
+        self._save_index()
+
+    def _view(self):
+        if self._mmap is None:
+            self._file = open(self.pack_path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def names(self):
+        return sorted(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, name):
+        entry = self.index[name]
+        view = self._view()
+        segment = view[entry['offset']:entry['offset'] + entry['length']]
+        return zlib.decompress(segment).decode('utf-8')
+
+    def fingerprint(self, name):
+        """Size and mtime of the `.txt` file `name` was packed from, for callers caching per-document results."""
+        entry = self.index[name]
+        return [entry['source_size'], entry['source_mtime']]
+
+    def load(self, names=None):
+        """Returns `{paper_name: text}` for `names` (default: every document), in name order."""
+        selected = self.names() if names is None else sorted(name for name in names if name in self.index)
+        return {name: self.get(name) for name in selected}
+
+
+def open_corpus(folder=os.path.join('outputs', 'extracted_text')):
+    """Opens the packed corpus of `folder`, packing any text files that changed since the last call."""
+    return TextCorpus(folder).sync()
+
+
+def load_corpus_texts(folder=os.path.join('outputs', 'extracted_text'), names=None):
+    if not os.path.exists(folder):
+        return {}
+    with open_corpus(folder) as corpus:
+        return corpus.load(names)
+
+
+class RunCorpus:
+    """Per-run view of the extracted texts shared by the analysis stages.
+
+    Documents read one at a time through `text`/`lower`, which the pipeline
+    does for the session's papers only, are kept with their lowercased form
+    for the rest of the run. Bulk reads through `texts` (unless `keep` is
+    set) and the `clean_text` output and token lists that the corpus-wide
+    stages need are computed on demand and not kept, so a run holds only
+    the session's documents in memory.
+    """
+
+    def __init__(self, folder=os.path.join('outputs', 'extracted_text'), sync=True):
+        self.folder = folder
+        self._corpus = open_corpus(folder) if sync and os.path.exists(folder) else TextCorpus(folder)
+        self._texts = {}
+        self._lower = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._corpus.close()
+
+    def names(self):
+        return self._corpus.names()
+
+    def __contains__(self, name):
+        return name in self._corpus
+
+    def fingerprint(self, name):
+        return self._corpus.fingerprint(name)
+
+    def _read(self, name):
+        text = self._texts.get(name)
+        return text if text is not None else self._corpus.get(name)
+
+    def text(self, name):
+        if name not in self._texts:
+            self._texts[name] = self._corpus.get(name)
+        return self._texts[name]
+
+    def lower(self, name):
+        if name not in self._lower:
+            self._lower[name] = self.text(name).lower()
+        return self._lower[name]
+
+    def cleaned(self, name):
+        from .key_phrase_extractor import clean_text
+        return clean_text(self._read(name))
+
+    def tokens(self, name):
+        return self.cleaned(name).split()
+
+    def texts(self, names=None, keep=False):
+        """Returns `{paper_name: text}` for `names` (default: every document), in name order.
+
+        With `keep`, the texts are cached like `text` does, for stages that go on to scan the same papers.
+        """
+        selected = self.names() if names is None else sorted(name for name in names if name in self)
+        read = self.text if keep else self._read
+        return {name: read(name) for name in selected}
+
+
+@contextmanager
+def use_corpus(corpus=None, folder=os.path.join('outputs', 'extracted_text')):
+    """Yields `corpus` if one was passed in, otherwise a RunCorpus over `folder` that is closed afterwards."""
+    if corpus is not None:
+        yield corpus
+        return
+    with RunCorpus(folder) as own_corpus:
+        yield own_corpus
+
+
+_worker_corpus = None
+
+
+def _init_corpus_worker(folder):
+    global _worker_corpus
+    _worker_corpus = RunCorpus(folder, sync=False)
+
+
+def _run_corpus_task(task, name, args):
+    return task(_worker_corpus, name, *args)
+
+
+def map_corpus(corpus, task, names, workers=None, args=None):
+    """Yields `task(corpus, name, *args[i])` for every name, in order.
+
+    `args`, if given, holds one tuple of extra arguments per name, so each
+    call receives only its own slice of any precomputed data. With more than
+    one worker the calls run in a process pool whose workers open the
+    already-synced pack of `corpus.folder` read-only; `task` must be a
+    picklable module-level callable and should return its errors instead of
+    raising, since the caller merges the results.
+    """
+    names = list(names)
+    args = [()] * len(names) if args is None else list(args)
+    workers = min(workers or os.cpu_count() or 1, len(names))
+    if workers <= 1:
+        for name, extra in zip(names, args):
+            yield task(corpus, name, *extra)
+        return
+
+    chunksize = max(1, len(names) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_corpus_worker,
+                             initargs=(corpus.folder,)) as pool:
+        yield from pool.map(partial(_run_corpus_task, task), names, args, chunksize=chunksize)